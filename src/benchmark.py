@@ -0,0 +1,173 @@
+from solver import find_path, initializeGame, load_map, map_solution_to_keys, SearchStats, UNKNOWN, Players, CellGrid
+from generator import make_grid, place_food_and_players
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+parser = argparse.ArgumentParser(description='Measure the solver on the shipped maps and on seeded random maps.')
+parser.add_argument('output', type=str, nargs='?', help='Name of the file the results are written to.')
+parser.add_argument('-b', '--baseline', type=str, help='Results of an earlier run, regressions against it are reported.')
+parser.add_argument('-c', '--compare', type=str, nargs=2, metavar=('BASELINE', 'RESULTS'), help='Only compare two earlier runs.')
+parser.add_argument('--optimal', action='store_true', help='Benchmark the shortest solution search.')
+parser.add_argument('--ida', action='store_true', help='Benchmark the low-memory shortest solution search.')
+parser.add_argument('--sizes', type=int, nargs='+', default=[5, 7, 9, 11], help='Sizes of the random maps.')
+parser.add_argument('--count', type=int, default=5, help='Number of random maps of each size.')
+parser.add_argument('--seed', type=int, default=0, help='Seed of the random maps.')
+parser.add_argument('--repeat', type=int, default=1, help='Number of timed runs of each map, the fastest one is kept.')
+parser.add_argument('--threshold', type=float, default=10, help='Percentage a measurement may grow before it counts as a regression.')
+
+map_folders = ["Maps/Tutorial", "Maps/Teleports", "Maps/Switches and Gates", "Maps/One Player as Two"]
+random_probability = 25
+# Random placements tried on one wall layout before a new layout is drawn.
+placement_attempts = 20
+# Differences below this many seconds are noise, not regressions.
+min_time_difference = 0.01
+measurements = ["time", "expanded", "max_frontier", "max_visited", "peak_memory"]
+
+
+def load_maps() -> Dict[str, tuple[CellGrid, Players]]:
+    maps = {}
+    for folder in map_folders:
+        for file in sorted(file for file in os.listdir(folder) if ".json" in file):
+            maps[f"{folder}/{file}"] = initializeGame(load_map(f"{folder}/{file}"))
+    return maps
+
+
+def make_solvable_map(size: int, food_count: int, player_count: int, rng: random.Random) -> tuple[CellGrid, Players]:
+    # Most random placements can not be solved and are given up on after a few nodes, so like the
+    # generator only the solvable ones are kept.
+    while True:
+        grid = make_grid(size, random_probability, rng)
+        for _ in range(placement_attempts):
+            players = place_food_and_players(grid, food_count, player_count, rng)
+            for id, player in enumerate(players):
+                player.id = id
+            if find_path(players, grid) is not None:
+                return grid, players
+            for row in grid:
+                for cell in row:
+                    cell.food = False
+
+
+def make_random_maps(sizes: List[int], count: int, seed: int) -> Dict[str, tuple[CellGrid, Players]]:
+    maps = {}
+    for size in sizes:
+        # Every size has its own seed, so the maps of one size do not depend on the other sizes.
+        rng = random.Random(seed * 1000 + size)
+        for index in range(count):
+            maps[f"random/{size}x{size}-{index}"] = make_solvable_map(size, size // 2 + 2, 1 + index % 2, rng)
+    return maps
+
+
+def measure(grid: CellGrid, players: Players, optimal: bool, ida: bool, repeat: int) -> Dict[str, Any]:
+    best_time = None
+    best_stats = SearchStats()
+    for _ in range(repeat):
+        stats = SearchStats()
+        start = time.perf_counter()
+        path = find_path(players, grid, optimal=optimal, ida=ida, stats=stats)
+        elapsed = time.perf_counter() - start
+        # The counts of the run the time is taken from.
+        if best_time is None or elapsed < best_time:
+            best_time, best_stats = elapsed, stats
+
+    # Tracing allocations slows the search down a lot, so memory gets a run of its own.
+    tracemalloc.start()
+    find_path(players, grid, optimal=optimal, ida=ida)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "time": round(best_time or 0, 6),
+        "expanded": best_stats.expanded,
+        "max_frontier": best_stats.max_frontier,
+        "max_visited": best_stats.max_visited,
+        "peak_memory": peak_memory,
+        "length": "unknown" if path is UNKNOWN else len(map_solution_to_keys(path)) if path is not None else None
+    }
+
+
+def run(optimal=False, ida=False, sizes: List[int] = [5, 7, 9, 11], count=5, seed=0, repeat=1) -> Any:
+    maps = load_maps()
+    maps.update(make_random_maps(sizes, count, seed))
+
+    results = {}
+    for name, (grid, players) in maps.items():
+        try:
+            results[name] = measure(grid, players, optimal, ida, repeat)
+        except IndexError as e:
+            results[name] = {"error": str(e)}
+        result = results[name]
+        if "error" in result:
+            print(f"{name}: {result['error']}")
+        else:
+            print(f"{name}: {result['time']:.3f} s, {result['expanded']} expanded, length {result['length']}")
+
+    return {
+        "options": {"optimal": optimal, "ida": ida, "sizes": sizes, "count": count, "seed": seed, "repeat": repeat},
+        "total_time": round(sum(result.get("time", 0) for result in results.values()), 6),
+        "maps": results
+    }
+
+
+def compare(baseline: Any, results: Any, threshold: float) -> List[str]:
+    regressions = []
+    if baseline["options"] != results["options"]:
+        print(f"Runs were made with different options: {baseline['options']} and {results['options']}")
+
+    for name, old in baseline["maps"].items():
+        new = results["maps"].get(name)
+        if new is None:
+            print(f"{name}: missing from the new results")
+            continue
+        if "error" in old or "error" in new:
+            if old.get("error") != new.get("error"):
+                regressions.append(f"{name}: error changed from {old.get('error')} to {new.get('error')}")
+            continue
+        if old["length"] != new["length"]:
+            regressions.append(f"{name}: solution length changed from {old['length']} to {new['length']}")
+        for key in measurements:
+            if new[key] > old[key] * (1 + threshold / 100):
+                if key == "time" and new[key] - old[key] < min_time_difference:
+                    continue
+                regressions.append(f"{name}: {key} grew from {old[key]} to {new[key]}")
+
+    for name in results["maps"].keys():
+        if name not in baseline["maps"]:
+            print(f"{name}: missing from the baseline")
+
+    print(f"Total time: {baseline['total_time']:.3f} s -> {results['total_time']:.3f} s")
+    return regressions
+
+
+def report(regressions: List[str]):
+    if len(regressions) == 0:
+        print("No regressions.")
+        return
+    print(f"{len(regressions)} regressions:")
+    for regression in regressions:
+        print(regression)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.compare:
+        report(compare(load_map(args.compare[0]), load_map(args.compare[1]), args.threshold))
+    else:
+        if not args.output:
+            parser.error("Name of the output file is required.")
+        if args.repeat < 1 or args.count < 0:
+            parser.error("Number of runs should be at least 1 and number of random maps can not be negative.")
+        if any(size < 4 or size > 13 for size in args.sizes):
+            parser.error("Sizes of random maps should be between 4 and 13.")
+        results = run(args.optimal, args.ida, args.sizes, args.count, args.seed, args.repeat)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        if args.baseline:
+            report(compare(load_map(args.baseline), results, args.threshold))
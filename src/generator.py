@@ -1,13 +1,16 @@
-from solver import find_path, Cell, Player, Switch, Gate, oppositeDirDic, directionDic, load_map, initializeGame, map_solution_to_keys, Players, CellGrid, Path
+from solver import find_path, food_reachable, prove_unsolvable, is_unsolvable, find_path_record, find_path_after_edit, SearchRecord, SolutionCache, SearchBudget, UNKNOWN, SlideTable, Cell, Player, Switch, Gate, oppositeDirDic, directionDic, load_map, initializeGame, map_solution_to_keys, Players, CellGrid, Path
 from typing import List, Dict, Any, TypedDict
 import json
-from random import randint, randrange, sample
+import argparse
+from random import Random, randrange, sample
 from PIL import Image, ImageDraw, ImageFont
+import numpy as np
 import copy
 import os
 import shutil
-from itertools import product, combinations
-import math
+from functools import cached_property, lru_cache, partial
+from multiprocessing import Pool
+from itertools import product
 
 MapsDict = Dict[str, tuple[str, 'Map']]
 
@@ -20,6 +23,27 @@ class PositionElement(NonOptionalPositionElement, total=False):
     otherX: int
     otherY: int
 
+class BatchConfig(TypedDict):
+    size: int
+    players: int
+    food: int
+    probability: int
+    elements: List[str]
+    count: int
+    seed: int
+
+
+parser = argparse.ArgumentParser(description='Make maps interactively, or a batch of them without any prompts when an output folder is given.')
+parser.add_argument('output', type=str, nargs='?', help='Folder the batch of maps is written to.')
+parser.add_argument('--size', type=int, default=7, help='Map size of the batch (min 4, max 13).')
+parser.add_argument('--players', type=int, default=1, help='Number of players of the batch (min 1, max 2).')
+parser.add_argument('--food', type=int, default=5, help='Food count of the batch (min 1, max 20).')
+parser.add_argument('--probability', type=int, default=20, help='Wall probability of the batch (min 1, max 40).')
+parser.add_argument('--elements', type=str, nargs='*', default=["wall", "teleport", "gate"], choices=["wall", "food", "teleport", "gate"], help='Elements added to every map of the batch, in this order.')
+parser.add_argument('--count', type=int, default=1, help='Number of maps in the batch.')
+parser.add_argument('--seed', type=int, default=0, help='Seed of the first map, every next map uses the next seed.')
+parser.add_argument('-j', '--jobs', type=int, help='Number of worker processes, all cores by default.')
+
 
 teleport_image_path = './src/teleport.png'
 teleport_image = Image.open(teleport_image_path)
@@ -27,7 +51,20 @@ cell_size = 120
 teleport_img_size = int(cell_size * 0.6)
 teleport_image = teleport_image.resize((teleport_img_size, teleport_img_size))
 walls = ['up', 'down', 'left', 'right']
+wall_index = {wall: index for index, wall in enumerate(walls)}
 improved = ["Longer route", "Same length, different route", "Same route", "Shorter route"]
+solution_cache = SolutionCache()
+# Candidate maps whose search expands more nodes than this are skipped instead of stalling the session.
+search_node_budget = 100_000
+# Worker processes evaluating suggestion candidates and generating random maps, 1 does it all in this process.
+pool_jobs = os.cpu_count() or 1
+# Random food and player placements tried on one wall layout before making a new layout.
+layout_attempts = 20
+# Base map of the suggestions evaluated by a worker process.
+candidate_context: Dict[str, Any] = {}
+# Previews are only kept in memory for the combined image, unless this is set.
+save_previews = False
+wall_thickness = 4
 
 
 def input_int(message: str, min: int, max: int) -> int:
@@ -46,66 +83,131 @@ def input_int(message: str, min: int, max: int) -> int:
 def reset_color(grid: CellGrid):
     for i in range(len(grid)):
         for j in range(len(grid)):
-            grid[i][j].reset_color()
+            if grid[i][j].color != "":
+                edit_cell(grid, j, i).reset_color()
+
+
+class GridClone(list):
+
+    def __init__(self, rows: CellGrid):
+        # Rows and cells already copied by edit_cell, the others are shared with other grids.
+        super().__init__(rows)
+        self.own_rows: set[int] = set()
+        self.own_cells: set[tuple[int, int]] = set()
+
+
+def clone_grid(grid: CellGrid) -> CellGrid:
+    # The clone shares its rows and cells with the grid, edit_cell copies them when they change.
+    if isinstance(grid, GridClone):
+        grid.own_rows.clear()
+        grid.own_cells.clear()
+    return GridClone(grid)
+
+
+def edit_cell(grid: CellGrid, x: int, y: int) -> Cell:
+    # Gives the grid its own copy of the cell (and of its row) before the cell gets changed, the
+    # grids it was cloned from or into keep the old one. A clone copies each row and cell only
+    # once, other grids can not tell what they share and copy them on every edit.
+    owned = isinstance(grid, GridClone)
+    if not owned or y not in grid.own_rows:
+        grid[y] = list(grid[y])
+        if owned:
+            grid.own_rows.add(y)
+    if not owned or (x, y) not in grid.own_cells:
+        cell = copy.copy(grid[y][x])
+        cell.walls = set(cell.walls)
+        grid[y][x] = cell
+        if owned:
+            grid.own_cells.add((x, y))
+    return grid[y][x]
+
+
+def wall_arrays(grids: List[CellGrid]) -> np.ndarray:
+    # result[grid, wall, y, x], walls in the order of `walls`. All grids have the same size.
+    size = len(grids[0]) if len(grids) != 0 else 0
+    result = np.zeros((len(grids), len(walls), size, size), dtype=bool)
+    for index, grid in enumerate(grids):
+        for row in grid:
+            for cell in row:
+                for wall in cell.walls:
+                    result[index, wall_index[wall], cell.y, cell.x] = True
+    return result
 
 
-def symm(cell: Cell, other_cell: Cell, wall: str, other_wall: str) -> int:
-    return 1 if wall in cell.walls and other_wall in other_cell.walls else 0
+def food_arrays(grids: List[CellGrid]) -> np.ndarray:
+    size = len(grids[0]) if len(grids) != 0 else 0
+    result = np.zeros((len(grids), size, size), dtype=bool)
+    for index, grid in enumerate(grids):
+        for row in grid:
+            for cell in row:
+                result[index, cell.y, cell.x] = cell.food
+    return result
 
 
-def rotational_symmetry_score(grid: CellGrid, degrees: int) -> int:
+def rotational_symmetry_scores(wall_array: np.ndarray, degrees: int) -> np.ndarray:
     rotation_map = {'up': 'right', 'right': 'down', 'down': 'left', 'left': 'up'} if degrees == 90 else {'up': 'down', 'down': 'up', 'left': 'right', 'right': 'left'}
-    size = len(grid)
-    score = 0
-    for y in range(1, size - 1):
-        for x in range(1, size - 1):
-            cell_walls = grid[y][x].walls
-            rotated_walls = set(rotation_map[wall] for wall in cell_walls)
-            if degrees == 90:
-                new_x, new_y = size - y - 1, x
-            elif degrees == 180:
-                new_x, new_y = size - x - 1, size - y - 1
-            
-            for wall in rotated_walls:
-                if wall in grid[new_y][new_x].walls:
-                    score += 1
+    # rotated[..., y, x] is the cell (x, y) is rotated onto, only inner cells are scored.
+    rotated = np.rot90(wall_array, 1 if degrees == 90 else 2, axes=(-2, -1))
+    score = np.zeros(len(wall_array), dtype=int)
+    for wall, rotated_wall in rotation_map.items():
+        matches = wall_array[:, wall_index[wall], 1:-1, 1:-1] & rotated[:, wall_index[rotated_wall], 1:-1, 1:-1]
+        score += matches.sum(axis=(-2, -1))
     return score
 
 
-def symmetry_score(grid: CellGrid) -> int:
-    size = len(grid)
+def symmetry_scores(wall_array: np.ndarray) -> np.ndarray:
+    size = wall_array.shape[-1]
     half = size // 2 if size % 2 == 1 else size // 2 - 1
+    up, down, left, right = (wall_array[:, wall_index[wall]] for wall in ['up', 'down', 'left', 'right'])
 
-    vertical_score = sum([
-        symm(grid[i][index], grid[-(i + 1)][index], "down", "up") +
-        symm(grid[i][index], grid[-(i + 1)][index], "right", "right") if index != size - 1 else 0 for i in range(half) for index in range(size)
-    ])
-    horizontal_score = sum([
-        symm(grid[index][i], grid[index][-(i + 1)], "right", "left") +
-        symm(grid[index][i], grid[index][-(i + 1)], "down", "down") if index != size - 1 else 0 for i in range(half) for index in range(size)
-    ])
+    # Cells mirrored over the horizontal and the vertical axis, without the last column or row.
+    vertical_score = (down & up[:, ::-1])[:, :half, :-1].sum(axis=(-2, -1)) + (right & right[:, ::-1])[:, :half, :-1].sum(axis=(-2, -1))
+    horizontal_score = (right & left[:, :, ::-1])[:, :-1, :half].sum(axis=(-2, -1)) + (down & down[:, :, ::-1])[:, :-1, :half].sum(axis=(-2, -1))
 
-    score_90 = rotational_symmetry_score(grid, 90)
+    score_90 = rotational_symmetry_scores(wall_array, 90)
 
-    score_180 = rotational_symmetry_score(grid, 180) // 2
+    score_180 = rotational_symmetry_scores(wall_array, 180) // 2
 
     return horizontal_score + vertical_score + score_90 + score_180
 
 
-def calculate_distance(p1: tuple[int, int], p2: tuple[int, int]) -> float:
-    return math.sqrt((p2[0] - p1[0]) ** 2 + (p2[1] - p1[1]) ** 2)
+def food_scores(food_array: np.ndarray) -> np.ndarray:
+    # Average distance between every two food cells, rounded down.
+    flat = food_array.reshape(len(food_array), food_array.shape[-2] * food_array.shape[-1])
+    cells = np.flatnonzero(flat.any(axis=0))
+    first, second = np.triu_indices(len(cells), 1)
+    ys, xs = np.divmod(cells, food_array.shape[-1])
+    distances = np.sqrt((xs[second] - xs[first]) ** 2 + (ys[second] - ys[first]) ** 2)
+    pairs = flat[:, cells[first]] & flat[:, cells[second]]
+    # Summed in order, pair after pair, so the totals are exactly those of a plain loop.
+    totals = np.cumsum(np.where(pairs, distances, 0.0), axis=-1)[:, -1] if len(distances) != 0 else np.zeros(len(flat))
+    counts = pairs.sum(axis=-1)
+    return np.where(counts != 0, np.floor_divide(totals, np.maximum(counts, 1)), 0).astype(int)
+
+
+def score_grids(grids: List[CellGrid]) -> tuple[np.ndarray, np.ndarray]:
+    # Symmetry and food scores of a batch of grids of the same size.
+    return symmetry_scores(wall_arrays(grids)), food_scores(food_arrays(grids))
+
+
+def rotational_symmetry_score(grid: CellGrid, degrees: int) -> int:
+    return int(rotational_symmetry_scores(wall_arrays([grid]), degrees)[0])
+
+
+def symmetry_score(grid: CellGrid) -> int:
+    return int(symmetry_scores(wall_arrays([grid]))[0])
 
 
 def food_score(grid: CellGrid) -> int:
-    food_items = [(item.x, item.y) for row in grid for item in row if item.food]
-    distances = [calculate_distance(p1, p2) for p1, p2 in combinations(food_items, 2)]
-    return int(sum(distances) // len(distances)) if len(distances) != 0 else 0
+    return int(food_scores(food_arrays([grid]))[0])
 
 
-def solvable_with_one_player(grid: CellGrid, players: Players) -> bool:
+def solvable_with_one_player(grid: CellGrid, players: Players, table: SlideTable | None = None) -> bool:
     for player in players:
         new_players = [player]
-        if find_path(new_players, grid) is not None:
+        if prove_unsolvable(new_players, grid, table=table):
+            continue
+        if find_path(new_players, grid, table=table, cache=solution_cache) is not None:
             return True
     return False
 
@@ -152,16 +254,33 @@ def get_priority_score(grid: CellGrid, path: Path, type:str) -> int:
 
 
 class Map:
-    def __init__(self, grid: CellGrid, path: Path, improvement: int, players: Players, priority_score=0):
+    def __init__(self, grid: CellGrid, path: Path, improvement: int, players: Players, priority_score=0, table: SlideTable | None = None, symm_score: int | None = None, food_score: int | None = None):
         self.grid = grid
         self.path = path
         self.improvement = improvement
         self.players = players
         self.priority_score = priority_score
-        self.symm_score = symmetry_score(grid)
-        self.food_score = food_score(grid)
-        self.one_player_solvable = solvable_with_one_player(grid, players) if len(players) == 2 else True
-        
+        # Scores are computed when first used, unless they were already scored with a batch of
+        # other grids. The table only speeds up the one player searches.
+        self.table = table
+        if symm_score is not None:
+            self.symm_score = symm_score
+        if food_score is not None:
+            self.food_score = food_score
+
+    @cached_property
+    def symm_score(self) -> int:
+        return symmetry_score(self.grid)
+
+    @cached_property
+    def food_score(self) -> int:
+        return food_score(self.grid)
+
+    @cached_property
+    def one_player_solvable(self) -> bool:
+        solvable = solvable_with_one_player(self.grid, self.players, self.table) if len(self.players) == 2 else True
+        self.table = None
+        return solvable
 
     def get_items(self):
         return self.grid, self.path, self.players
@@ -188,7 +307,7 @@ def export_cells(grid: CellGrid):
 
     for cell_row in grid:
         for cell in cell_row:
-            new_cell = {"x": cell.x, "y": cell.y, "walls": list(cell.walls)}
+            new_cell = {"x": cell.x, "y": cell.y, "walls": [wall for wall in walls if wall in cell.walls]}
             if cell.food:
                 new_cell['food'] = True
                 food_count += 1
@@ -256,69 +375,94 @@ def draw_dashed_line(draw, start, end, color, width=1, dash_length=10):
         draw.line([segment_start, segment_end], fill=color, width=width)
 
     
-def save_map_image(file_name: str, map: Map, show_path=True):
+@lru_cache(maxsize=None)
+def blank_layer(size: int) -> Image.Image:
+    # White map with only the outer walls, the same for every map of this size. Copy before drawing on it.
+    img_size = size * cell_size
+    image = Image.new("RGB", (img_size, img_size), "white")
+    draw = ImageDraw.Draw(image)
+    draw.line([(0, 0), (0, img_size)], fill="black", width=wall_thickness)
+    draw.line([(img_size, 0), (img_size, img_size)], fill="black", width=wall_thickness)
+    draw.line([(0, 0), (img_size, 0)], fill="black", width=wall_thickness)
+    draw.line([(0, img_size), (img_size, img_size)], fill="black", width=wall_thickness)
+    return image
 
-    grid, solved_map, players = map.get_items()
 
+def draw_cell(image: Image.Image, draw: ImageDraw.ImageDraw, cell: Cell):
+    x, y = cell.x, cell.y
+    walls = cell.walls
+    food = cell.food
 
-    size = len(grid)
 
-    player_path = map_path_to_positions(solved_map, get_teleport_coords(map.get_grid()))
+    top_left = (x * cell_size, y * cell_size)
+    bottom_right = ((x + 1) * cell_size, (y + 1) * cell_size)
 
 
-    wall_thickness = 4
-    img_size = size * cell_size
-    image = Image.new("RGB", (img_size, img_size), "white")
-    draw = ImageDraw.Draw(image)
+    if "left" in walls: 
+        draw.line([top_left, (top_left[0], bottom_right[1])], fill="orange" if cell.color == "left" else "black", width=wall_thickness)
+    if "right" in walls:  
+        draw.line([(bottom_right[0], top_left[1]), bottom_right], fill="orange" if cell.color == "right" else "black", width=wall_thickness)
+    if "up" in walls:
+        draw.line([top_left, (bottom_right[0], top_left[1])], fill="orange" if cell.color == "up" else "black", width=wall_thickness)
+    if "down" in walls:
+        draw.line([(top_left[0], bottom_right[1]), bottom_right], fill="orange" if cell.color == "down" else "black", width=wall_thickness)
 
 
+    if food:
+        food_center = (x * cell_size + cell_size // 2, y * cell_size + cell_size // 2)
+        draw.ellipse([food_center[0] - 12, food_center[1] - 12, food_center[0] + 12, food_center[1] + 12], fill="orange" if cell.color == "food" else "black")
+    
+    gate = cell.gate
+    if gate:
+        gate_orientation = gate.orientation
+        if gate_orientation == "left":
+            gate_start = (top_left[0], top_left[1])
+            gate_end = (top_left[0], bottom_right[1])
+        elif gate_orientation == "right":
+            gate_start = (bottom_right[0], top_left[1])
+            gate_end = (bottom_right[0], bottom_right[1])
+        elif gate_orientation == "up":
+            gate_start = (top_left[0], top_left[1])
+            gate_end = (bottom_right[0], top_left[1])
+        elif gate_orientation == "down":
+            gate_start = (top_left[0], bottom_right[1])
+            gate_end = (bottom_right[0], bottom_right[1])
+        draw_dashed_line(draw, gate_start, gate_end, "red", wall_thickness // 2, 12)
+    if cell.switch:
+        draw_custom_rectangles(draw, x, y, cell_size)
+    if cell.teleport:
+        paste_x = (x * cell_size) + (cell_size - teleport_img_size) // 2
+        paste_y = (y * cell_size) + (cell_size - teleport_img_size) // 2
+
+        image.paste(teleport_image, (paste_x, paste_y), teleport_image)
+
+
+def looks_the_same(cell: Cell, other: Cell) -> bool:
+    if cell is other:
+        return True
+    return cell.walls == other.walls and cell.food == other.food and cell.color == other.color and cell.teleport == other.teleport \
+        and (cell.gate.orientation if cell.gate else None) == (other.gate.orientation if other.gate else None) and bool(cell.switch) == bool(other.switch)
+
+
+def render_layout(grid: CellGrid, base: tuple[CellGrid, Image.Image] | None = None) -> Image.Image:
+    # Walls, food and elements of the map. Given the rendered layout of a map it was made from by
+    # adding elements, only the cells that look different get drawn over a copy of it.
+    image = base[1].copy() if base is not None else blank_layer(len(grid)).copy()
+    draw = ImageDraw.Draw(image)
     for cell in [item for sublist in grid for item in sublist]:
-        x, y = cell.x, cell.y
-        walls = cell.walls
-        food = cell.food
+        if base is None or not looks_the_same(cell, base[0][cell.y][cell.x]):
+            draw_cell(image, draw, cell)
+    return image
 
 
-        top_left = (x * cell_size, y * cell_size)
-        bottom_right = ((x + 1) * cell_size, (y + 1) * cell_size)
+def render_map(map: Map, show_path=True, layout: Image.Image | None = None) -> Image.Image:
 
+    grid, solved_map, players = map.get_items()
 
-        if "left" in walls or x == 0: 
-            draw.line([top_left, (top_left[0], bottom_right[1])], fill="orange" if cell.color == "left" else "black", width=wall_thickness)
-        if "right" in walls or x == size - 1:  
-            draw.line([(bottom_right[0], top_left[1]), bottom_right], fill="orange" if cell.color == "right" else "black", width=wall_thickness)
-        if "up" in walls or y == 0:
-            draw.line([top_left, (bottom_right[0], top_left[1])], fill="orange" if cell.color == "up" else "black", width=wall_thickness)
-        if "down" in walls or y == size - 1:
-            draw.line([(top_left[0], bottom_right[1]), bottom_right], fill="orange" if cell.color == "down" else "black", width=wall_thickness)
-
+    player_path = map_path_to_positions(solved_map, get_teleport_coords(map.get_grid()))
 
-        if food:
-            food_center = (x * cell_size + cell_size // 2, y * cell_size + cell_size // 2)
-            draw.ellipse([food_center[0] - 12, food_center[1] - 12, food_center[0] + 12, food_center[1] + 12], fill="orange" if cell.color == "food" else "black")
-        
-        gate = cell.gate
-        if gate:
-            gate_orientation = gate.orientation
-            if gate_orientation == "left":
-                gate_start = (top_left[0], top_left[1])
-                gate_end = (top_left[0], bottom_right[1])
-            elif gate_orientation == "right":
-                gate_start = (bottom_right[0], top_left[1])
-                gate_end = (bottom_right[0], bottom_right[1])
-            elif gate_orientation == "up":
-                gate_start = (top_left[0], top_left[1])
-                gate_end = (bottom_right[0], top_left[1])
-            elif gate_orientation == "down":
-                gate_start = (top_left[0], bottom_right[1])
-                gate_end = (bottom_right[0], bottom_right[1])
-            draw_dashed_line(draw, gate_start, gate_end, "red", wall_thickness // 2, 12)
-        if cell.switch:
-            draw_custom_rectangles(draw, x, y, cell_size)
-        if cell.teleport:
-            paste_x = (x * cell_size) + (cell_size - teleport_img_size) // 2
-            paste_y = (y * cell_size) + (cell_size - teleport_img_size) // 2
-
-            image.paste(teleport_image, (paste_x, paste_y), teleport_image)
+    image = layout.copy() if layout is not None else render_layout(grid)
+    draw = ImageDraw.Draw(image)
 
     if show_path:
         for player in range(len(player_path)):
@@ -333,7 +477,25 @@ def save_map_image(file_name: str, map: Map, show_path=True):
         player_center = (player.x * cell_size + cell_size // 2, player.y * cell_size + cell_size // 2)
         draw.ellipse([player_center[0] - 20, player_center[1] - 20, player_center[0] + 20, player_center[1] + 20], fill="red")
 
-    image.save(file_name)
+    return image
+
+
+def save_map_image(file_name: str, map: Map, show_path=True):
+    render_map(map, show_path).save(file_name)
+
+
+def render_preview(base: tuple[CellGrid, Image.Image] | None, item: tuple[str, Map]) -> Image.Image:
+    file_name, map = item
+    image = render_map(map, True, render_layout(map.get_grid(), base))
+    if save_previews:
+        image.save(file_name)
+    return image
+
+
+def render_previews(maps: MapsDict, base_grid: CellGrid | None = None) -> List[Image.Image]:
+    # Suggestions share the layout of the map they were made from, so it is drawn only once.
+    base = (base_grid, render_layout(base_grid)) if base_grid is not None else None
+    return [render_preview(base, item) for item in maps.values()]
 
 
 def map_path_to_coordinates(item: Path, teleport: List[tuple[int, int]]) -> List[List[tuple[int, int]]]:
@@ -391,7 +553,9 @@ def map_path_to_positions(path: Path, teleport: List[tuple[int, int]], unique=Fa
     return result
 
 
-def remove_adjacent_wall(position: PositionElement, positions: List[PositionElement]) -> List[PositionElement]:
+def remove_adjacent_wall(position: PositionElement, pending: List[int], positions: List[PositionElement]) -> List[int]:
+    # Indexes of the positions still to go through, without the first one of the same wall seen
+    # from the other side.
     x, y = position.get("x", 0), position.get("y", 0)
     wall = position.get("wall", "")
     newX, newY = x + directionDic[wall][0], y + directionDic[wall][1]
@@ -400,17 +564,17 @@ def remove_adjacent_wall(position: PositionElement, positions: List[PositionElem
 
     newPosition = {"x": newX, "y": newY, "wall": newWall}
 
-    if newPosition in positions:
-        positions.remove(newPosition)
+    for index, item in enumerate(pending):
+        if positions[item] == newPosition:
+            del pending[index]
+            break
 
-    return positions
+    return pending
 
 
-def generate_image(maps: MapsDict, base_path: str, type: str, init_map: bool):
+def generate_image(maps: MapsDict, map_images: List[Image.Image], base_path: str, type: str, init_map: bool):
     global map_save_index
 
-    map_images = [Image.open(maps[i][0]) for i in maps.keys()]
-
     two_players = len(maps["0"][1].players) == 2
 
     img_width, img_height = map_images[0].size
@@ -450,7 +614,7 @@ def generate_image(maps: MapsDict, base_path: str, type: str, init_map: bool):
     combined_img.show()
 
 
-def make_grid(size: int, prob: int) -> CellGrid:
+def make_grid(size: int, prob: int, rng: Random) -> CellGrid:
     grid = [[Cell(x, y) for x in range(size)] for y in range(size)]
     for y in range(size):
         for x in range(size):
@@ -465,7 +629,7 @@ def make_grid(size: int, prob: int) -> CellGrid:
                 cell.addWall("down")
             for wall in walls:
                 if not wall in cell.walls:
-                    if randrange(100) < prob:
+                    if rng.randrange(100) < prob:
                         cell.addWall(wall)
                         newX, newY = x + directionDic[wall][0], y + directionDic[wall][1]
                         grid[newY][newX].addWall(oppositeDirDic[wall])
@@ -477,13 +641,13 @@ def abs_distance(first:tuple[int, int], second: tuple[int, int]) -> tuple[int, i
     return (abs(first[0] - second[0]), abs(first[1] - second[1]))
 
 
-def generate_food_coords(foodSet: set[tuple[int, int]], size) -> tuple[int, int]:
+def generate_food_coords(foodSet: set[tuple[int, int]], size, rng: Random) -> tuple[int, int]:
     unique_row = {item[1] for item in foodSet}
     unique_col = {item[0] for item in foodSet}
 
     cond = len(unique_row) / size < 0.80 and len(unique_col) / size < 0.80
     while True:
-        coords = (randint(0, size - 1), randint(0, size - 1))
+        coords = (rng.randint(0, size - 1), rng.randint(0, size - 1))
         if cond:
             if coords[0] in unique_col or coords[1] in unique_row:
                 continue
@@ -492,6 +656,67 @@ def generate_food_coords(foodSet: set[tuple[int, int]], size) -> tuple[int, int]
             return coords
 
 
+def place_food_and_players(grid: CellGrid, food_count: int, player_count: int, rng: Random) -> Players:
+    size = len(grid)
+    foodSet = set()
+    while len(foodSet) != food_count:
+        x, y = generate_food_coords(foodSet, size, rng)
+        foodSet.add((x,y))
+        grid[y][x].addFood()
+
+    players = []
+
+    while len(players) != player_count:
+        x, y = rng.randint(0, size - 1), rng.randint(0, size - 1)
+        if grid[y][x].food:
+            continue
+        players.append(Player(x, y))
+    return players
+
+
+def find_random_map(size: int, player_count: int, food_count: int, probability: int, map_seed: int) -> tuple[CellGrid, Path, Players]:
+    # A generator of its own, so the map only depends on its seed and not on what else was drawn
+    # in this process.
+    rng = Random(map_seed)
+    while True:
+        layout = make_grid(size, probability, rng)
+        # Slides do not depend on the food, so one table of the layout filters every placement on
+        # it and only gets its food bits redone for the placements that are searched.
+        layout_table = SlideTable(layout)
+        for _ in range(layout_attempts):
+            players = place_food_and_players(layout, food_count, player_count, rng)
+            if food_reachable(players, layout, layout_table):
+                table = layout_table.with_food(layout)
+                if not prove_unsolvable(players, layout, table=table):
+                    solved_map = find_path(players, layout, table=table, budget=SearchBudget(search_node_budget))
+                    if solved_map is not None and solved_map is not UNKNOWN:
+                        return layout, solved_map, players
+            for row in layout:
+                for cell in row:
+                    cell.food = False
+
+
+def find_random_maps(size: int, player_count: int, food_count: int, probability: int, count: int, jobs: int | None = None, first_seed: int | None = None) -> List[tuple[CellGrid, Path, Players]]:
+    # Every map has its own seed, so they can be found in any order and on any worker.
+    if first_seed is None:
+        first_seed = randrange(2 ** 32)
+    seeds = [first_seed + index for index in range(count)]
+    find_one = partial(find_random_map, size, player_count, food_count, probability)
+    jobs = pool_jobs if jobs is None else jobs
+    if jobs > 1 and count > 1:
+        with Pool(min(jobs, count)) as pool:
+            return pool.map(find_one, seeds, chunksize=1)
+    return [find_one(map_seed) for map_seed in seeds]
+
+
+def rank_random_maps(size: int, player_count: int, food_count: int, probability: int, count=50, jobs: int | None = None, first_seed: int | None = None) -> List[Map]:
+    solved_maps = find_random_maps(size, player_count, food_count, probability, count, jobs, first_seed)
+
+    symm_batch, food_batch = score_grids([grid for grid, _, _ in solved_maps])
+    new_maps = [Map(grid, solved_map, 0, players, symm_score=int(symm), food_score=int(food)) for (grid, solved_map, players), symm, food in zip(solved_maps, symm_batch, food_batch)]
+    return sorted(new_maps, key=lambda item: (len(item.path), item.symm_score + item.food_score), reverse=True)
+
+
 def make_random_map(base_path: str) -> bool:
     global map_save_index
     map_save_index = 1
@@ -509,60 +734,17 @@ def make_random_map(base_path: str) -> bool:
     if probability == -1:
         return False
 
-    grid = make_grid(size, probability)
-
-    new_maps = []
-
-    grid_backup = copy.deepcopy(grid)
-
-    index = 0
-
-    while len(new_maps) != 50:
-        foodSet = set()
-        while len(foodSet) != food_count:
-            x, y = generate_food_coords(foodSet, len(grid))
-            foodSet.add((x,y))
-            grid[y][x].addFood()
-
-        players = []
-
-        while len(players) != player_count:
-            x, y = randint(0, size - 1), randint(0, size - 1)
-            if grid[y][x].food:
-                continue
-            players.append(Player(x, y))
-        
-        
-        solved_map = find_path(players, grid)
-
-        if solved_map is not None:
-            new_maps.append(Map(grid, solved_map, 0, players))
-            grid_backup = make_grid(size, probability)
-            index = 0
-    
-        index += 1
-        if index == 20:
-            grid_backup = make_grid(size, probability)
-            index = 0
-        grid = copy.deepcopy(grid_backup)
-
+    new_maps = rank_random_maps(size, player_count, food_count, probability)
     
     prepare_folder(base_path, "random")
 
     selected_maps = {}
 
-    for index, value in enumerate(sorted(new_maps, key=lambda item: (len(item.path), item.symm_score + item.food_score), reverse=True)):
-        # print(key)
-        if index == 8:
-            break
-        
-        grid, solved_map, players = value.get_items()
-
+    for index, value in enumerate(new_maps[:8]):
         path = f"{base_path}/temp/random/img{index}.png"
         selected_maps[str(index)] = (path, value)
-        save_map_image(path, value)
 
-    generate_image(selected_maps, base_path, "random", True)
+    generate_image(selected_maps, render_previews(selected_maps), base_path, "random", True)
     while True:
         inp = input("Select index of chosen map or press q to quit. \n")
 
@@ -590,7 +772,7 @@ def init(base_path: str, map_name: str) -> tuple[CellGrid | None, Players | None
 
     grid, players = initializeGame(map)
 
-    solved_map = find_path(players, grid)
+    solved_map = find_path(players, grid, cache=solution_cache)
 
     if solved_map is None:
         return None, None, None
@@ -637,27 +819,26 @@ def try_add_teleport(grid: CellGrid, x: int, y: int, otherX: int, otherY: int) -
         "y": otherY
     }
 
-    grid[port_two["y"]][port_two["x"]].addTeleport(port_one)
-    grid[port_one["y"]][port_one["x"]].addTeleport(port_two)
+    edit_cell(grid, port_two["x"], port_two["y"]).addTeleport(port_one)
+    edit_cell(grid, port_one["x"], port_one["y"]).addTeleport(port_two)
 
     return True
 
 
 def try_add_gate(grid: CellGrid, x: int, y: int, otherX: int, otherY: int, wall: str, players: Players) -> bool:
-    backup_grid = copy.deepcopy(grid)
+    backup_grid = clone_grid(grid)
 
     if try_add_wall(backup_grid, x, y, wall, players, False):
-        path = find_path(players, backup_grid)
-        if path is None:
+        if is_unsolvable(players, backup_grid, cache=solution_cache, budget=SearchBudget(search_node_budget)):
             mySwitch = Switch(otherX, otherY)
-            grid[mySwitch.y][mySwitch.x].addSwitch(mySwitch)
+            edit_cell(grid, mySwitch.x, mySwitch.y).addSwitch(mySwitch)
 
-            grid[y][x].addGate(Gate(x, y, wall, mySwitch))
+            edit_cell(grid, x, y).addGate(Gate(x, y, wall, mySwitch))
             newX, newY = x + directionDic[wall][0], y + directionDic[wall][1]
-            grid[newY][newX].addGate(Gate(newX, newY, oppositeDirDic[wall], mySwitch))
+            edit_cell(grid, newX, newY).addGate(Gate(newX, newY, oppositeDirDic[wall], mySwitch))
 
-            new_path = find_path(players, grid)
-            return new_path is not None
+            new_path = find_path(players, grid, cache=solution_cache, budget=SearchBudget(search_node_budget))
+            return new_path is not None and new_path is not UNKNOWN
     return False
 
 
@@ -667,8 +848,9 @@ def try_add_food(grid: CellGrid, players: Players, x: int, y: int) -> bool:
     for player in players:
         if player.x == x and player.y == y:
             return False
-    grid[y][x].addFood()
-    grid[y][x].color = "food"
+    cell = edit_cell(grid, x, y)
+    cell.addFood()
+    cell.color = "food"
     return True
 
 
@@ -679,15 +861,16 @@ def try_add_wall(grid: CellGrid, x: int, y: int, orientation: str, players: Play
     if has_teleport_on_cells(grid, x, y, otherX, otherY) or orientation in grid[y][x].walls:
         return False
 
-    grid[y][x].walls.add(orientation)
-    grid[y][x].color = orientation
+    cell = edit_cell(grid, x, y)
+    cell.walls.add(orientation)
+    cell.color = orientation
 
-    grid[otherY][otherX].walls.add(oppositeDirDic[orientation])
-    grid[otherY][otherX].color = oppositeDirDic[orientation]
+    other = edit_cell(grid, otherX, otherY)
+    other.walls.add(oppositeDirDic[orientation])
+    other.color = oppositeDirDic[orientation]
 
     if has_sg:
-        new_grid = copy.deepcopy(grid)
-        return find_path(players, new_grid, True) is None
+        return is_unsolvable(players, grid, True, solution_cache, SearchBudget(search_node_budget))
 
     return True
 
@@ -710,7 +893,22 @@ def try_add_element(grid: CellGrid, players: Players, type: str, position: Posit
     return False
 
 
-def get_positions_for_type(type: str, path: Path, grid: CellGrid, players: Players) -> List[PositionElement]:
+def get_edited_cells(type: str, position: PositionElement) -> List[tuple[int, int]]:
+    x, y = position.get("x", 0), position.get("y", 0)
+    if type == "wall" or type == "gate":
+        wall = position.get("wall", "")
+        cells = [(x, y), (x + directionDic[wall][0], y + directionDic[wall][1])]
+        if type == "gate":
+            cells.append((position.get("otherX", 0), position.get("otherY", 0)))
+        return cells
+    elif type == "teleport":
+        return [(x, y), (position.get("otherX", 0), position.get("otherY", 0))]
+    return [(x, y)]
+
+
+def get_positions_for_type(type: str, path: Path, grid: CellGrid, players: Players, rng: Random | None = None) -> List[PositionElement]:
+    # Positions are sampled with the module's generator unless one is given.
+    pick = rng.sample if rng is not None else sample
     players_coords = [(player.x, player.y) for player in players]
     if type == "food":
         return [{"x" : x, "y": y} for x in range(len(grid)) for y in range(len(grid)) if not grid[y][x].food and (x, y) not in players_coords]
@@ -723,72 +921,107 @@ def get_positions_for_type(type: str, path: Path, grid: CellGrid, players: Playe
         positions = [(x, y) for x in range(len(grid)) for y in range(len(grid)) if not grid[y][x].food and (x, y) not in players_coords]
         temp = {tuple(sorted((first, second))) for first, second in product(positions, repeat=2) if first != second}
         result: List[PositionElement] = [{"x": first[0], "y": first[1], "otherX": second[0], "otherY": second[1]} for first, second in temp if first in path_positions or second in path_positions]
-        return sample(result, 500) if len(result) > 500 else result
+        return pick(result, 500) if len(result) > 500 else result
     elif type == "gate":
         positions = list(product(map_path_to_positions(path, [], True)[0], walls))
         temp = []
         cells_with_down_wall = [cell for row in grid for cell in row if "down" in cell.walls and not cell.food and (cell.x, cell.y) not in players_coords]
 
         for position in positions:
-            temp += sample([{"x": position[0][0], "y": position[0][1], "wall": position[1], "otherX": item.x, "otherY": item.y} for item in cells_with_down_wall ], 5)
+            temp += pick([{"x": position[0][0], "y": position[0][1], "wall": position[1], "otherX": item.x, "otherY": item.y} for item in cells_with_down_wall ], 5)
         return temp
      
     return []
 
     
-def get_all_map_suggestions(grid:CellGrid, players: Players, base_path: str, type: str) -> MapsDict | None:
-    path = find_path(players, grid)
+def evaluate_candidate(grid: CellGrid, players: Players, type: str, position: PositionElement, has_sg: bool, record: SearchRecord) -> tuple[bool, Any]:
+    # Whether the element could be added, and the candidate map when it is also solvable.
+    new_grid = clone_grid(grid)
+    if not try_add_element(new_grid, players, type, position, has_sg):
+        return False, None
+    priority_score = get_priority_score(new_grid, record.path, type)
+    new_path = find_path_after_edit(players, new_grid, record, get_edited_cells(type, position), solution_cache, SearchBudget(search_node_budget)).path
+    if new_path is None or new_path is UNKNOWN:
+        return True, None
+
+    solved_map = map_solution_to_keys(record.path)
+    new_solved_map = map_solution_to_keys(new_path)
+    if new_solved_map != solved_map and len(new_solved_map) >= len(solved_map):
+        improvement = 0 if len(new_solved_map) > len(solved_map) else 1
+    else:
+        improvement = 3 if len(new_solved_map) < len(solved_map) else 2
+    return True, (new_grid, new_path, improvement, priority_score)
+
+
+def init_candidate_worker(grid: CellGrid, players: Players, type: str, has_sg: bool, record: SearchRecord):
+    candidate_context.update(grid=grid, players=players, type=type, has_sg=has_sg, record=record)
+
+
+def evaluate_candidate_in_worker(position: PositionElement) -> tuple[bool, Any]:
+    context = candidate_context
+    return evaluate_candidate(context["grid"], context["players"], context["type"], position, context["has_sg"], context["record"])
+
+
+def rank_map_suggestions(grid: CellGrid, players: Players, type: str, jobs: int | None = None, rng: Random | None = None) -> tuple[Map, List[Map]] | None:
+    # The map itself and every map with one more element of the type, best ones first.
+    record = find_path_record(players, grid)
+    path = record.path
 
     if path is None:
         return None
-    base_map = Map(grid, path, 0, players)
+    base_map = Map(grid, path, 0, players, table=record.table)
 
-    solved_map = map_solution_to_keys(path)
-    global map_save_index
-    new_grid = copy.deepcopy(grid)
     result: Dict[int, Map] = {}
 
-    positions = get_positions_for_type(type, path, grid, players)
-    priority_score = 0
+    positions = get_positions_for_type(type, path, grid, players, rng)
 
     has_sg = has_switch_and_gate(grid)
 
-    index = 0
-    while positions:
-        position = positions.pop()
-        if try_add_element(new_grid, players, type, position, has_sg):
-            if type == "wall":
-                positions = remove_adjacent_wall(position, positions)
-            priority_score = get_priority_score(new_grid, path, type)
-            new_path = find_path(players, new_grid)
-            new_solved_map = map_solution_to_keys(new_path)
-            if new_solved_map != solved_map and new_path is not None and len(new_solved_map) >= len(solved_map):
-                result[index] = Map(new_grid, new_path, 0 if len(new_solved_map) > len(solved_map) else 1, players, priority_score)
-                index += 1
-            elif new_path is not None:
-                result[index] = Map(new_grid, new_path, 3 if len(new_solved_map) < len(solved_map) else 2, players, priority_score)
-                index += 1
-        new_grid = copy.deepcopy(grid)
-
-    if not result:
+    # Candidates do not depend on each other, so workers evaluate all of them up front. Going
+    # through them below in the same order keeps the skipped adjacent walls exactly the same.
+    jobs = pool_jobs if jobs is None else jobs
+    outcomes: List[tuple[bool, Any]] | None = None
+    if jobs > 1 and len(positions) > 1:
+        with Pool(min(jobs, len(positions)), init_candidate_worker, (grid, players, type, has_sg, record)) as pool:
+            outcomes = pool.map(evaluate_candidate_in_worker, positions, chunksize=len(positions) // (jobs * 4) + 1)
+
+    candidates = []
+    pending = list(range(len(positions)))
+    while pending:
+        index = pending.pop()
+        position = positions[index]
+        if outcomes is not None:
+            added, candidate = outcomes[index]
+        else:
+            added, candidate = evaluate_candidate(grid, players, type, position, has_sg, record)
+        if added and type == "wall":
+            pending = remove_adjacent_wall(position, pending, positions)
+        if candidate is not None:
+            candidates.append(candidate)
+
+    # Only the symmetry score is needed to rank the candidates.
+    symm_batch = symmetry_scores(wall_arrays([candidate[0] for candidate in candidates]))
+    for index, ((new_grid, new_path, improvement, priority_score), symm) in enumerate(zip(candidates, symm_batch)):
+        result[index] = Map(new_grid, new_path, improvement, players, priority_score, symm_score=int(symm))
+
+    return base_map, sorted(result.values(), key=lambda item: (item.priority_score, len(item.path), item.symm_score), reverse=True)
+
+
+def get_all_map_suggestions(grid:CellGrid, players: Players, base_path: str, type: str, jobs: int | None = None) -> MapsDict | None:
+    global map_save_index
+    ranked = rank_map_suggestions(grid, players, type, jobs)
+    if ranked is None or len(ranked[1]) == 0:
         return None
+    base_map, suggestions = ranked
 
     prepare_folder(base_path, type)
 
     selected_maps = {"0" : (f"{base_path}/temp/{type}/img0.png", base_map)}
 
-    save_map_image(selected_maps["0"][0], selected_maps["0"][1])
-
-    for index, (_, value) in enumerate(sorted(result.items(), key=lambda item: (item[1].priority_score, len(item[1].path), item[1].symm_score), reverse=True)):
-        if index == 7:
-            break
-        
-        grid, solved_map, players = value.get_items()
-
+    for index, value in enumerate(suggestions[:7]):
         selected_maps[str(index + 1)] = (f"{base_path}/temp/{type}/img{index + 1}.png", value)
-        save_map_image(selected_maps[str(index + 1)][0], selected_maps[str(index + 1)][1])
 
-    generate_image(selected_maps, base_path, type, False)
+    generate_image(selected_maps, render_previews(selected_maps, base_map.get_grid()), base_path, type, False)
     return selected_maps
 
 
@@ -835,7 +1068,7 @@ def add_food(grid: CellGrid, players: Players, map: Any, base_path: str) -> tupl
 
 def add_manual_wall(grid: CellGrid, players: Players, map: Any, base_path: str) -> CellGrid:
     global map_save_index
-    new_grid = copy.deepcopy(grid)
+    new_grid = clone_grid(grid)
     inp = input("Enter coordinates and wall orientation with spaces between, e.g.: \'0 1 right\' or q to quit. \n")
 
     inp = inp.split(" ")
@@ -856,7 +1089,7 @@ def add_manual_wall(grid: CellGrid, players: Players, map: Any, base_path: str)
 
     try_add_wall(new_grid, x, y, wall, players, has_switch_and_gate(grid))
 
-    path = find_path(players, new_grid)
+    path = find_path(players, new_grid, cache=solution_cache)
 
     if path is None:
         print("Map is unsolvable, reverting...")
@@ -985,7 +1218,69 @@ def generate():
         else:
             print("wrong command \n")
 
+def generate_map(config: BatchConfig, map_seed: int, jobs: int | None = None) -> Map:
+    # What generate() does with someone always picking the first suggestion: the best random map,
+    # then the best map with each of the elements added in turn.
+    # Everything random comes from the map's own generator, so the map is the same whichever process
+    # makes it and whatever it made before.
+    rng = Random(map_seed)
+    map = rank_random_maps(config["size"], config["players"], config["food"], config["probability"], jobs=jobs, first_seed=rng.randrange(2 ** 32))[0]
+    for type in config["elements"]:
+        grid, _, players = map.get_items()
+        if type == "teleport" and has_teleports(grid):
+            continue
+        ranked = rank_map_suggestions(grid, players, type, jobs, rng)
+        if ranked is not None and len(ranked[1]) != 0:
+            map = ranked[1][0]
+            reset_color(map.get_grid())
+    return map
+
+
+def generate_batch(config: BatchConfig, base_path: str, jobs: int | None = None) -> List[str]:
+    if not os.path.exists(base_path):
+        os.makedirs(base_path)
+    seeds = [config["seed"] + index for index in range(config["count"])]
+    jobs = pool_jobs if jobs is None else jobs
+
+    file_names = []
+    def save(index: int, map: Map):
+        file_name = f"{base_path}/map{index + 1}.json"
+        with open(file_name, "w") as f:
+            json.dump(export_map(map), f, indent=4)
+        file_names.append(file_name)
+
+    if jobs > 1 and len(seeds) > 1:
+        # Workers can not start pools of their own, so every worker makes its maps alone.
+        with Pool(min(jobs, len(seeds))) as pool:
+            for index, map in enumerate(pool.imap(partial(generate_map, config, jobs=1), seeds)):
+                save(index, map)
+    else:
+        for index, map_seed in enumerate(seeds):
+            save(index, generate_map(config, map_seed, jobs))
+    return file_names
+
+
 map_save_index = 1
 
 if __name__ == "__main__":
-    generate()
+    args = parser.parse_args()
+    if args.output is None:
+        generate()
+    else:
+        if args.size < 4 or args.size > 13 or args.players < 1 or args.players > 2 or args.food < 1 or args.food > 20 or args.probability < 1 or args.probability > 40:
+            parser.error("Size should be between 4 and 13, players between 1 and 2, food between 1 and 20 and probability between 1 and 40.")
+        if args.food + args.players >= args.size * args.size:
+            parser.error("Food and players do not fit on the map.")
+        if args.count < 1 or (args.jobs is not None and args.jobs < 1):
+            parser.error("Number of maps and jobs should be at least 1.")
+        config: BatchConfig = {
+            "size": args.size,
+            "players": args.players,
+            "food": args.food,
+            "probability": args.probability,
+            "elements": args.elements,
+            "count": args.count,
+            "seed": args.seed
+        }
+        for file_name in generate_batch(config, args.output, args.jobs):
+            print(file_name)
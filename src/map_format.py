@@ -0,0 +1,217 @@
+from solver import createGrid, load_map, Player, Switch, Gate, CellGrid, Players
+from typing import Any, Dict, List
+import argparse
+import json
+import mmap
+import os
+import struct
+
+parser = argparse.ArgumentParser(description='Pack a folder of JSON maps into one binary corpus file, or unpack a corpus file into JSON maps.')
+parser.add_argument('input', type=str, help='Folder of JSON maps to pack, or corpus file to unpack.')
+parser.add_argument('output', type=str, help='Corpus file to write, or folder to write the unpacked maps to.')
+
+MAGIC = b"SMAP"
+VERSION = 1
+# Corpus header: magic, version, number of maps. Every map then has an index entry with the offset
+# of its record and the length of its name, the names follow the index and the records the names.
+HEADER = struct.Struct("<4sBI")
+INDEX_ENTRY = struct.Struct("<IH")
+# Record header: size, number of players, teleports and gate cells. Then x and y of every player and
+# teleport, x, y and orientation of every gate cell, x and y of the switch when there are gates, and
+# one byte for every cell row by row.
+RECORD_HEADER = struct.Struct("<BBBB")
+
+# Cell bits are the same as in the txt levels of transform_level.py, the player bit is not used
+# because the players are stored in order in the record header.
+UP, RIGHT, DOWN, LEFT, PLAYER, FOOD = 1, 2, 4, 8, 16, 32
+wall_bits = {"up": UP, "down": DOWN, "left": LEFT, "right": RIGHT}
+orientations = list(wall_bits.keys())
+WALLS = UP | RIGHT | DOWN | LEFT
+# Walls of every value of the wall bits, so that a cell is decoded with one lookup.
+cell_walls = [tuple(wall for wall, bit in wall_bits.items() if value & bit) for value in range(WALLS + 1)]
+
+
+def encode_map(data: Any) -> bytes:
+    size = data["gridSize"]
+    players = data.get("players", [])
+    teleports = data.get("teleports", [])
+    gates = data["gate"]["cells"] if "gate" in data else []
+
+    record = bytearray(RECORD_HEADER.pack(size, len(players), len(teleports), len(gates)))
+    for item in players + teleports:
+        record += bytes((item["x"], item["y"]))
+    for gate in gates:
+        record += bytes((gate["x"], gate["y"], orientations.index(gate["orientation"])))
+    if len(gates) != 0:
+        record += bytes((data["gate"]["switch"]["x"], data["gate"]["switch"]["y"]))
+
+    cells = bytearray(size * size)
+    for cell in data["cells"]:
+        value = FOOD if cell.get("food", False) else 0
+        for wall in cell["walls"]:
+            value |= wall_bits[wall]
+        cells[cell["y"] * size + cell["x"]] |= value
+    return bytes(record + cells)
+
+
+def read_record(buffer: Any, offset: int) -> tuple[int, List[tuple[int, int]], List[tuple[int, int]], List[tuple[int, int, str]], tuple[int, int] | None, Any]:
+    size, player_count, teleport_count, gate_count = RECORD_HEADER.unpack_from(buffer, offset)
+    offset += RECORD_HEADER.size
+    players = [(buffer[offset + 2 * index], buffer[offset + 2 * index + 1]) for index in range(player_count)]
+    offset += 2 * player_count
+    teleports = [(buffer[offset + 2 * index], buffer[offset + 2 * index + 1]) for index in range(teleport_count)]
+    offset += 2 * teleport_count
+    gates = [(buffer[offset + 3 * index], buffer[offset + 3 * index + 1], orientations[buffer[offset + 3 * index + 2]]) for index in range(gate_count)]
+    offset += 3 * gate_count
+    switch = None
+    if gate_count != 0:
+        switch = (buffer[offset], buffer[offset + 1])
+        offset += 2
+    return size, players, teleports, gates, switch, buffer[offset:offset + size * size]
+
+
+def decode_map(buffer: Any, offset=0) -> Any:
+    size, players, teleports, gates, switch, cells = read_record(buffer, offset)
+    data: Dict[str, Any] = {"gridSize": size, "players": [{"x": x, "y": y} for x, y in players]}
+
+    data_cells = []
+    for index, value in enumerate(cells):
+        cell: Dict[str, Any] = {"x": index % size, "y": index // size, "walls": list(cell_walls[value & WALLS])}
+        if value & FOOD:
+            cell["food"] = True
+        data_cells.append(cell)
+    data["cells"] = data_cells
+
+    if switch is not None:
+        data["gate"] = {
+            "switch": {"x": switch[0], "y": switch[1]},
+            "cells": [{"orientation": orientation, "x": x, "y": y} for x, y, orientation in gates]
+        }
+    if len(teleports) != 0:
+        data["teleports"] = [{"x": x, "y": y} for x, y in teleports]
+    return data
+
+
+def build_game(buffer: Any, offset=0) -> tuple[CellGrid, Players]:
+    # The same grid and players initializeGame makes from the JSON map, straight from the bytes.
+    size, player_cells, teleports, gates, switch, cells = read_record(buffer, offset)
+    grid = createGrid(size)
+    for index, value in enumerate(cells):
+        if value != 0:
+            cell = grid[index // size][index % size]
+            cell.walls.update(cell_walls[value & WALLS])
+            if value & FOOD:
+                cell.addFood()
+
+    players = [Player(x, y) for x, y in player_cells]
+    for index, item in enumerate(players):
+        item.id = index
+
+    if len(teleports) != 0:
+        (x_one, y_one), (x_two, y_two) = teleports[0], teleports[1]
+        grid[y_two][x_two].addTeleport({"x": x_one, "y": y_one})
+        grid[y_one][x_one].addTeleport({"x": x_two, "y": y_two})
+
+    if switch is not None:
+        mySwitch = Switch(switch[0], switch[1])
+        grid[mySwitch.y][mySwitch.x].addSwitch(mySwitch)
+        for x, y, orientation in gates:
+            grid[y][x].addGate(Gate(x, y, orientation, mySwitch))
+
+    return grid, players
+
+
+def write_corpus(file_name: str, maps: Dict[str, Any]):
+    names = [name.encode() for name in maps.keys()]
+    records = [encode_map(data) for data in maps.values()]
+
+    offset = HEADER.size + INDEX_ENTRY.size * len(names) + sum(len(name) for name in names)
+    with open(file_name, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names)))
+        for name, record in zip(names, records):
+            f.write(INDEX_ENTRY.pack(offset, len(name)))
+            offset += len(record)
+        for name in names:
+            f.write(name)
+        for record in records:
+            f.write(record)
+
+
+class Corpus:
+    # Maps of a corpus file, the file is memory mapped and a map is only decoded when it is asked for.
+    def __init__(self, file_name: str):
+        self.file = open(file_name, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{file_name} is empty.")
+        magic, version, count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{file_name} is not a map corpus of version {VERSION}.")
+
+        self.offsets: List[int] = []
+        name_lengths = []
+        for index in range(count):
+            offset, name_length = INDEX_ENTRY.unpack_from(self.buffer, HEADER.size + INDEX_ENTRY.size * index)
+            self.offsets.append(offset)
+            name_lengths.append(name_length)
+        self.names: List[str] = []
+        position = HEADER.size + INDEX_ENTRY.size * count
+        for name_length in name_lengths:
+            self.names.append(self.buffer[position:position + name_length].decode())
+            position += name_length
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def index(self, map: int | str) -> int:
+        return self.indexes[map] if isinstance(map, str) else map
+
+    def game(self, map: int | str) -> tuple[CellGrid, Players]:
+        return build_game(self.buffer, self.offsets[self.index(map)])
+
+    def map(self, map: int | str) -> Any:
+        return decode_map(self.buffer, self.offsets[self.index(map)])
+
+    def close(self):
+        if hasattr(self, "buffer"):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self) -> 'Corpus':
+        return self
+
+    def __exit__(self, *exception: Any):
+        self.close()
+
+
+def pack_folder(folder: str, file_name: str) -> int:
+    maps = {file: load_map(f"{folder}/{file}") for file in sorted(file for file in os.listdir(folder) if ".json" in file)}
+    write_corpus(file_name, maps)
+    return len(maps)
+
+
+def unpack_corpus(file_name: str, folder: str) -> int:
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    with Corpus(file_name) as corpus:
+        for index, name in enumerate(corpus.names):
+            with open(f"{folder}/{name}", "w") as f:
+                json.dump(corpus.map(index), f, indent=4)
+        return len(corpus)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if not os.path.exists(args.input):
+        parser.error("Input does not exist.")
+    if os.path.isdir(args.input):
+        print(f"Packed {pack_folder(args.input, args.output)} maps into {args.output}.")
+    else:
+        try:
+            print(f"Unpacked {unpack_corpus(args.input, args.output)} maps into {args.output}.")
+        except ValueError as e:
+            parser.error(str(e))
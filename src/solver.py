@@ -1,15 +1,31 @@
 import json
 import copy
+import heapq
+import hashlib
 import time
-from typing import Any, Dict, List, TypedDict
+from typing import Any, Callable, Dict, Iterator, List, TypedDict
 import argparse
 import os
+import sys
+from collections import OrderedDict
+from functools import partial
+from multiprocessing import Pool
 
 parser = argparse.ArgumentParser(description='Optional app description')
 parser.add_argument('input_folder', type=str,
                     help='Folder name of the maps to be solved.')
 parser.add_argument('-m', '--map', type=str, help='Particular name of the map to solve.')
 parser.add_argument('-o', '--output', type=str, help='Name of the output file, otherwise output will be printed.')
+parser.add_argument('--optimal', action='store_true', help='Search for the shortest solution instead of the first one found.')
+parser.add_argument('--ida', action='store_true', help='Search for the shortest solution with low-memory IDA* (implies --optimal).')
+parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to solve a folder of maps.')
+parser.add_argument('--cache', type=str, help='Folder for cached solutions, maps solved before are not solved again.')
+parser.add_argument('--stats', action='store_true', help='Print search statistics of every solved map.')
+parser.add_argument('--progress', type=int, help='With --stats, also print them every this many expanded nodes.')
+parser.add_argument('--max-nodes', type=int, help='Give up on a map after expanding this many nodes, its result is null.')
+parser.add_argument('--timeout', type=float, help='Give up on a map after this many seconds, its result is null.')
+parser.add_argument('--stream', action='store_true', help='Write a JSON line for every map as soon as it is solved, instead of one object at the end.')
+parser.add_argument('--resume', action='store_true', help='With --stream and --output, skip the maps already in the output file.')
 
 
 class NonOptionalPathElement(TypedDict):
@@ -21,7 +37,7 @@ class PathElement(NonOptionalPathElement, total=False):
 
 Players = List['Player']
 CellGrid = List[List['Cell']]
-FoodSet = set[tuple[int, int]]
+PlayerCells = tuple[int, ...]
 Path = List[List[PathElement]]
 
 
@@ -30,75 +46,157 @@ def load_map(filename: str) -> Any:
         map_data = json.load(file)
     return map_data
 
+UNREACHABLE = sys.maxsize
+TRANSPOSITION_SIZE = 200_000
+CACHE_SIZE = 4096
+# Different food sets followed at once when proving a map unsolvable, past it the proof gives up.
+MAX_FOOD_COVERAGES = 256
+
 directionDic: Dict[str, tuple[int, int]] = {"down": (0, 1), "up": (0, -1), "left": (-1, 0), "right": (1, 0)}
 oppositeDirDic: Dict[str, str] = {"down": "up", "up": "down", "left": "right", "right": "left"}
 
 
-class Solution:
-    def __init__(self, players: Players, path: Path, foodSet: FoodSet, switch: bool, always_off_switch: bool):
-        self.players = players
-        self.path = path
-        self.foodSet = foodSet
-        self.switch = switch 
-        self.always_off_switch = always_off_switch
+class GridIndex:
+    def __init__(self, grid: CellGrid):
+        self.size = len(grid)
+        self.cell_bits = max(1, (self.size * self.size - 1).bit_length())
+        self.food_bits: Dict[tuple[int, int], int] = {}
+        for row in grid:
+            for cell in row:
+                if cell.food:
+                    self.food_bits[(cell.x, cell.y)] = 1 << len(self.food_bits)
+        self.all_food = (1 << len(self.food_bits)) - 1
+        # Players on the same row or column only affect each other through teleports and the
+        # switch, and only then does it matter which of them moves first on a tie.
+        self.interchangeable = not any(cell.teleport is not None or cell.gate is not None for row in grid for cell in row)
+
+    def cell_index(self, x: int, y: int) -> int:
+        if x < 0 or x >= self.size or y < 0 or y >= self.size:
+            raise IndexError(f"Cell ({x}, {y}) is outside of the grid.")
+        return y * self.size + x
+
+    def coords(self, cell: int) -> tuple[int, int]:
+        return cell % self.size, cell // self.size
 
-    def addFood(self, foodItem: tuple[int, int]):
-        self.foodSet.add(foodItem)
-        self.foodSet = set(sorted(self.foodSet))
-    
-    def addToPath(self, orient: str):
-        self.path.append([{"x": player.x, "y": player.y, "orient": orient} for player in sorted(self.players, key=lambda item: item.id)])
+    def __eq__(self, other):
+        if isinstance(other, GridIndex):
+            return self.size == other.size and self.food_bits == other.food_bits and self.interchangeable == other.interchangeable
+        return NotImplemented
+
+    def pack(self, cells: PlayerCells, switch: bool) -> int:
+        key = 0
+        for cell in sorted(cells) if self.interchangeable else cells:
+            key = (key << self.cell_bits) | cell
+        return (key << 1) | int(switch)
 
-    def get_last_distance(self):
-        if len(self.path) < 2:
+
+class Solution:
+    __slots__ = ("cells", "food", "switch", "key", "parent", "orient", "depth")
+
+    def __init__(self, cells: PlayerCells, food: int, switch: bool, index: GridIndex, parent: 'Solution | None' = None, orient: str | None = None):
+        self.cells = cells
+        self.food = food
+        self.switch = switch
+        self.key = index.pack(cells, switch)
+        self.parent = parent
+        self.orient = orient
+        self.depth = parent.depth + 1 if parent is not None else 0
+
+    def foodCount(self) -> int:
+        return self.food.bit_count()
+
+    def getNodes(self) -> List['Solution']:
+        nodes = []
+        node: Solution | None = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def getPath(self, index: GridIndex) -> Path:
+        nodes = self.getNodes()
+        path: Path = [[{"x": x, "y": y} for x, y in map(index.coords, nodes[0].cells)]]
+        for node in nodes[1:]:
+            path.append([{"x": x, "y": y, "orient": node.orient or ""} for x, y in map(index.coords, node.cells)])
+        return path
+
+    def get_last_distance(self, index: GridIndex):
+        if self.parent is None:
             return 0
-        first = self.path[-1][0]
-        second = self.path[-2][0]
-        return abs(first["x"] - second["x"]) + abs(first["y"] - second["y"])
+        first = index.coords(self.cells[0])
+        second = index.coords(self.parent.cells[0])
+        return abs(first[0] - second[0]) + abs(first[1] - second[1])
    
     def __eq__(self, other):
         if isinstance(other, Solution):
-            playersSorted = sorted(self.players, key=lambda item: (item.x, item.y))
-            otherSorted = sorted(other.players, key=lambda item: (item.x, item.y))
-            return (
-                playersSorted == otherSorted and 
-                self.foodSet == other.foodSet and
-                self.path == other.path and
-                self.switch == other.switch)
+            return self.key == other.key and self.food == other.food
+        return NotImplemented
         
     def __le__(self, other) -> bool:
         if isinstance(other, Solution):
-            playersSorted = sorted(self.players, key=lambda item: (item.x, item.y))
-            otherSorted = sorted(other.players, key=lambda item: (item.x, item.y))
-            return (
-                    playersSorted == otherSorted and 
-                    self.switch == other.switch and
-                    self.foodSet.issubset(other.foodSet))
-        return False
-    
-    def is_equal_or_subset(self, list_of_nodes: set['Solution']) -> bool:
-        for item in list_of_nodes:
-            if self <= item:
-                return True
+            return self.key == other.key and self.food & other.food == self.food
         return False
     
     def __hash__(self) -> int:
-        playersTuple = tuple(sorted((player.x, player.y) for player in self.players))
-        return hash((playersTuple, self.switch))
+        return hash(self.key)
     
     def __repr__(self) -> str:
-        arr = [x[0]['orient'] for x in self.path if "orient" in x[0]]
-        return f'path:{", ".join(arr)}'
+        return f'path:{", ".join(self.pathStr())}'
     
     def pathStr(self):
-        return [path[0]["orient"] for path in self.path if "orient" in path[0]]
+        return [node.orient for node in self.getNodes() if node.orient is not None]
+
+
+class VisitedSet:
+
+    def __init__(self, track_depth=False):
+        # Player cells and switch -> (food mask, depth) of visited nodes, none dominated by another.
+        # Without depth tracking every node counts as depth 0 and only the food masks matter.
+        self.track_depth = track_depth
+        self.nodes: Dict[int, List[tuple[int, int]]] = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def dominates(self, node: Solution) -> bool:
+        entries = self.nodes.get(node.key)
+        if entries is None:
+            return False
+        food = node.food
+        depth = node.depth if self.track_depth else 0
+        for mask, seen_depth in entries:
+            if mask & food == food and seen_depth <= depth:
+                return True
+        return False
+
+    def covers(self, key: int, food: int) -> bool:
+        # Whether a node of these cells and switch with at least this food was visited, at any depth.
+        return any(mask & food == food for mask, _ in self.nodes.get(key, []))
+
+    def add(self, node: Solution):
+        depth = node.depth if self.track_depth else 0
+        entries = self.nodes.get(node.key)
+        if entries is None:
+            self.nodes[node.key] = [(node.food, depth)]
+            self.size += 1
+            return
+        food = node.food
+        self.size -= len(entries)
+        entries[:] = [(mask, seen_depth) for mask, seen_depth in entries if mask & food != mask or seen_depth < depth]
+        entries.append((food, depth))
+        self.size += len(entries)
 
 
 class MyQueue:
 
     def __init__(self, nodes, food_count):
         self.food_count = food_count
-        self.nodes = nodes
+        self.nodes: List[tuple[Any, int, Solution]] = []
+        self.counter = 0
+        for node in nodes:
+            self.append(node)
 
     def __bool__(self):
         return not self.is_empty()
@@ -106,12 +204,166 @@ class MyQueue:
     def is_empty(self):
         return len(self.nodes) == 0
 
-    def append(self, node):
-        self.nodes.append(node)
+    def __len__(self):
+        return len(self.nodes)
+
+    def append(self, node, priority=None):
+        # Most food first unless told otherwise, ties in insertion order.
+        heapq.heappush(self.nodes, (-node.foodCount() if priority is None else priority, self.counter, node))
+        self.counter += 1
 
     def popleft(self) -> Solution:
-        self.nodes.sort(key=lambda node: (-len(node.foodSet)))
-        return self.nodes.pop(0)   
+        return heapq.heappop(self.nodes)[2]
+
+
+class SearchStats:
+
+    def __init__(self, callback: Callable[['SearchStats'], Any] | None = None, every=1000):
+        # Counters add up over every search the stats are passed to. The callback is called
+        # with the stats after every `every` expanded nodes.
+        self.callback = callback
+        self.every = every
+        self.popped = 0
+        self.expanded = 0
+        self.successors = 0
+        self.prunes = 0
+        self.noops = 0
+        self.max_frontier = 0
+        self.max_visited = 0
+        self.table_time = 0.0
+        self.search_time = 0.0
+        self.move_time = 0.0
+        self.search_started: float | None = None
+
+    def expand(self, frontier: int, visited: int):
+        self.expanded += 1
+        if frontier > self.max_frontier:
+            self.max_frontier = frontier
+        if visited > self.max_visited:
+            self.max_visited = visited
+        if self.callback is not None and self.expanded % self.every == 0:
+            self.callback(self)
+
+    def start_search(self):
+        self.search_started = time.perf_counter()
+
+    def stop_search(self):
+        if self.search_started is not None:
+            self.search_time += time.perf_counter() - self.search_started
+            self.search_started = None
+
+    def bookkeeping_time(self) -> float:
+        # Also correct while a search is still running, e.g. inside the callback.
+        search_time = self.search_time
+        if self.search_started is not None:
+            search_time += time.perf_counter() - self.search_started
+        return search_time - self.move_time
+
+    def __str__(self) -> str:
+        return (f"popped {self.popped}, expanded {self.expanded}, successors {self.successors}, "
+                f"dominance prunes {self.prunes}, no-op moves {self.noops}, max queue {self.max_frontier}, "
+                f"max visited {self.max_visited}, table {self.table_time:.3f} s, "
+                f"moves {self.move_time:.3f} s, bookkeeping {self.bookkeeping_time():.3f} s")
+
+
+class SearchInterrupted(Exception):
+    pass
+
+
+class SearchBudget:
+
+    def __init__(self, max_nodes: int | None = None, timeout: float | None = None):
+        # Expanded nodes add up over every search the budget is passed to, the timeout starts
+        # now. cancel() may be called from another thread or from a stats callback.
+        self.max_nodes = max_nodes
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.cancelled = False
+        self.nodes = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def spend(self):
+        self.nodes += 1
+        if self.cancelled:
+            raise SearchInterrupted("Search was cancelled.")
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchInterrupted(f"Search expanded more than {self.max_nodes} nodes.")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchInterrupted("Search ran out of time.")
+
+
+class Unknown:
+    def __repr__(self) -> str:
+        return "UNKNOWN"
+
+# Result of a search that could not tell whether the map is solvable, because it ran out of
+# budget or of room in its tables.
+UNKNOWN = Unknown()
+
+
+class SolutionCache:
+
+    def __init__(self, capacity=CACHE_SIZE, directory: str | None = None):
+        # Unsolvable maps are stored as an empty list, a solved path always has the start position.
+        self.capacity = capacity
+        self.directory = directory
+        self.entries: OrderedDict[str, Path] = OrderedDict()
+        if directory is not None and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get(self, key: str) -> Path | None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.directory is not None and os.path.exists(f"{self.directory}/{key}.json"):
+            path = load_map(f"{self.directory}/{key}.json")
+            self.remember(key, path)
+            return path
+        return None
+
+    def put(self, key: str, path: Path):
+        self.remember(key, path)
+        if self.directory is not None:
+            temp_name = f"{self.directory}/{key}.{os.getpid()}.tmp"
+            with open(temp_name, "w") as f:
+                json.dump(path, f)
+            os.replace(temp_name, f"{self.directory}/{key}.json")
+
+    def remember(self, key: str, path: Path):
+        self.entries[key] = path
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+def grid_key(players: Players, grid: CellGrid, **options: Any) -> str:
+    cells = []
+    for row in grid:
+        for cell in row:
+            cells.append([
+                sorted(cell.walls),
+                cell.food,
+                [cell.teleport["x"], cell.teleport["y"]] if cell.teleport is not None else None,
+                cell.gate.orientation if cell.gate is not None else None,
+                cell.switch is not None])
+    data = {
+        "players": [[player.x, player.y] for player in sorted(players, key=lambda item: item.id)],
+        "cells": cells,
+        "options": options
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+# One cache per folder and process, maps solved one after another by the same process share its
+# entries in memory instead of only the files.
+folder_caches: Dict[str, SolutionCache] = {}
+
+
+def folder_cache(directory: str) -> SolutionCache:
+    if directory not in folder_caches:
+        folder_caches[directory] = SolutionCache(directory=directory)
+    return folder_caches[directory]
 
 
 def createGrid(size: int) -> CellGrid:
@@ -169,33 +421,263 @@ def isAnotherPlayerOnCell(x: int, y: int, player: 'Player', players: Players) ->
     return False
 
 
-def sortedPlayers(players: Players, orientation: str) -> Players:
-    if orientation == "right":
-        return sorted(players, key=lambda player: player.x, reverse=True)
-    elif orientation == "left":
-        return sorted(players, key=lambda player: player.x)
-    elif orientation == "down":
-        return sorted(players, key=lambda player: player.y, reverse=True)
-    elif orientation == "up":
-        return sorted(players, key=lambda player: player.y)
-    return players
+class Slide:
+    def __init__(self, cells: List[int], food: List[int], toggles: List[bool], hops: List[bool]):
+        # Index 0 is the starting cell, every further index is one step (walk or teleport hop).
+        self.cells = tuple(cells)
+        self.food = tuple(food)
+        self.toggles = tuple(toggles)
+        self.hops = tuple(hops)
+        self.stop = cells[-1]
+        self.steps: Dict[int, int] = {}
+        for step in range(1, len(cells)):
+            self.steps.setdefault(cells[step], step)
+
+    def passes(self, cells: set[int]) -> bool:
+        return self.cells[0] in cells or any(cell in self.steps for cell in cells)
+
+    def with_food(self, food_bits: List[int]) -> 'Slide':
+        # Food is only picked up by walking onto a cell, never by a teleport hop. Most slides pass
+        # over no food and are shared with the table they came from.
+        if self.food[-1] == 0 and not any(food_bits[cell] for cell in self.cells[1:]):
+            return self
+        slide = copy.copy(self)
+        food = [0]
+        for cell, hop in zip(self.cells[1:], self.hops[1:]):
+            food.append(food[-1] if hop else food[-1] | food_bits[cell])
+        slide.food = tuple(food)
+        return slide
 
+    def __eq__(self, other):
+        if isinstance(other, Slide):
+            return self.cells == other.cells and self.food == other.food and self.toggles == other.toggles
+        return NotImplemented
 
-def movePlayers(solution: Solution, orientation: str, grid: CellGrid) -> Solution:
-    sortedPl = sortedPlayers(solution.players, orientation)
-    
-    for player in sortedPl:
+
+class SlideTable:
+    def __init__(self, grid: CellGrid, always_off_switch=False, previous: 'SlideTable | None' = None, edited: List[tuple[int, int]] | None = None):
+        self.index = GridIndex(grid)
+        self.always_off_switch = always_off_switch
+        size = self.index.size
+        self.xs = [cell % size for cell in range(size * size)]
+        self.ys = [cell // size for cell in range(size * size)]
+
+        self.switch_matters = not always_off_switch and any(cell.gate is not None for row in grid for cell in row)
+        # A slide only looks at the cells it passes over, so after editing a few cells of the grid
+        # the previous table's slides that stay clear of them still hold. Moving food around
+        # renumbers the food bits, then everything is built again.
+        touched: set[int] = set()
+        if previous is not None and edited is not None and previous.index == self.index and previous.always_off_switch == always_off_switch \
+                and previous.switch_matters == self.switch_matters and all(0 <= x < size and 0 <= y < size for x, y in edited):
+            touched = {self.index.cell_index(x, y) for x, y in edited}
+        else:
+            previous = None
+
+        self.distances: Dict[bool, List[List[int]]] = {}
+        self.slides: Dict[str, List[tuple[Slide, Slide]]] = {}
+        for direction in directionDic.keys():
+            row_slides = []
+            for cell in range(size * size):
+                if previous is not None:
+                    old = previous.slides[direction][cell]
+                    if not old[0].passes(touched) and not old[1].passes(touched):
+                        row_slides.append(old)
+                        continue
+                off = self.buildSlide(grid, cell, direction, False)
+                on = self.buildSlide(grid, cell, direction, True) if self.switch_matters else off
+                row_slides.append((off, on))
+            self.slides[direction] = row_slides
+
+    def with_food(self, grid: CellGrid) -> 'SlideTable':
+        # Table of the same walls and elements with the food placed differently. Where the slides go
+        # does not depend on the food, only what they pick up does.
+        table = copy.copy(self)
+        table.index = GridIndex(grid)
+        table.distances = {}
+        food_bits = [0] * len(self.xs)
+        for (x, y), bit in table.index.food_bits.items():
+            food_bits[table.index.cell_index(x, y)] = bit
+        table.slides = {}
+        for direction, slides in self.slides.items():
+            row_slides = []
+            for off, on in slides:
+                new_off = off.with_food(food_bits)
+                row_slides.append((new_off, on.with_food(food_bits) if on is not off else new_off))
+            table.slides[direction] = row_slides
+        return table
+
+    def same_moves(self, other: 'SlideTable', cells: set[int], heuristic=False) -> bool:
+        # Whether a search that only moved players from these cells (and, with a heuristic, only
+        # estimated states with players on them) goes exactly the same way on the other table.
+        if other.index != self.index:
+            return False
+        for direction in directionDic.keys():
+            slides = self.slides[direction]
+            other_slides = other.slides[direction]
+            if any(slides[cell] != other_slides[cell] for cell in cells):
+                return False
+        if heuristic:
+            for single_player, distances in self.distances.items():
+                other_distances = other.foodDistances(single_player)
+                for cell in cells:
+                    if distances[cell * 2] != other_distances[cell * 2] or distances[cell * 2 + 1] != other_distances[cell * 2 + 1]:
+                        return False
+        return True
+
+    def buildSlide(self, grid: CellGrid, cell: int, orientation: str, switch: bool) -> Slide:
+        player = Player(self.xs[cell], self.ys[cell])
+        players = [player]
+        cells, food, toggles, hops = [cell], [0], [False], [False]
         teleported = False
+        seen = {(cell, teleported, switch)}
+
         while(True):
-            newPosition = grid[player.y][player.x].move(player, orientation, teleported, grid, solution)
-            if newPosition is not None:
-                player.x = newPosition["cell"].x
-                player.y = newPosition["cell"].y
-                teleported = newPosition["teleported"]
-                solution.switch = newPosition['switch']
-            else:
+            newPosition = grid[player.y][player.x].move(player, orientation, teleported, grid, players, switch, self.always_off_switch)
+            if newPosition is None:
+                break
+            newCell = self.index.cell_index(newPosition["cell"].x, newPosition["cell"].y)
+            # A teleport pair lined up with open cells would send the player around forever.
+            if (newCell, newPosition["teleported"], newPosition["switch"]) in seen:
                 break
-    return solution
+            player.x = newPosition["cell"].x
+            player.y = newPosition["cell"].y
+            teleported = newPosition["teleported"]
+            seen.add((newCell, teleported, newPosition["switch"]))
+
+            foodBit = self.index.food_bits[(player.x, player.y)] if newPosition["food"] else 0
+            cells.append(newCell)
+            food.append(food[-1] | foodBit)
+            toggles.append(toggles[-1] != (newPosition["switch"] != switch))
+            hops.append(teleported)
+            switch = newPosition["switch"]
+
+        return Slide(cells, food, toggles, hops)
+
+    def foodDistances(self, single_player: bool) -> List[List[int]]:
+        # distances[cell * 2 + switch][bit]: fewest moves until a slide passes over that food cell.
+        # A lone player follows its slides exactly. With more players any prefix of a slide is a
+        # possible stop, because another player can cut it short, and either switch state is
+        # possible, because another player can flip it, so the bound never overestimates.
+        if single_player in self.distances:
+            return self.distances[single_player]
+
+        node_count = len(self.xs) * 2
+        food_count = len(self.index.food_bits)
+        reverse: List[set[int]] = [set() for _ in range(node_count)]
+        collects = [0] * node_count
+        for slides in self.slides.values():
+            for cell, variants in enumerate(slides):
+                for switch, slide in enumerate(variants):
+                    if single_player:
+                        node = cell * 2 + switch
+                        collects[node] |= slide.food[-1]
+                        reverse[slide.stop * 2 + (switch ^ slide.toggles[-1])].add(node)
+                        continue
+                    for node in (cell * 2, cell * 2 + 1):
+                        collects[node] |= slide.food[-1]
+                        for stop in slide.cells[1:]:
+                            reverse[stop * 2].add(node)
+                            reverse[stop * 2 + 1].add(node)
+
+        distances = [[UNREACHABLE] * food_count for _ in range(node_count)]
+        for bit in range(food_count):
+            frontier = [node for node in range(node_count) if collects[node] >> bit & 1]
+            for node in frontier:
+                distances[node][bit] = 1
+            depth = 1
+            while frontier:
+                depth += 1
+                next_frontier = []
+                for node in frontier:
+                    for previous in reverse[node]:
+                        if distances[previous][bit] > depth:
+                            distances[previous][bit] = depth
+                            next_frontier.append(previous)
+                frontier = next_frontier
+
+        self.distances[single_player] = distances
+        return distances
+
+    def heuristic(self, cells: PlayerCells, food: int, switch: bool) -> int:
+        # Every remaining food cell still needs at least its distance from the closest player.
+        distances = self.foodDistances(len(cells) == 1)
+        remaining = self.index.all_food & ~food
+        best = 0
+        while remaining:
+            lowest = remaining & -remaining
+            remaining ^= lowest
+            bit = lowest.bit_length() - 1
+            distance = min(distances[cell * 2 + switch][bit] for cell in cells)
+            if distance > best:
+                best = distance
+        return best
+
+
+def sortedPlayers(cells: PlayerCells, orientation: str, table: SlideTable) -> List[int]:
+    if len(cells) == 1:
+        return [0]
+    if len(cells) == 2:
+        # The same order sorted gives, ties keep the ids in order.
+        if orientation == "right" or orientation == "down":
+            coords = table.xs if orientation == "right" else table.ys
+            return [0, 1] if coords[cells[0]] >= coords[cells[1]] else [1, 0]
+        coords = table.xs if orientation == "left" else table.ys
+        return [0, 1] if coords[cells[0]] <= coords[cells[1]] else [1, 0]
+    ids = range(len(cells))
+    if orientation == "right":
+        return sorted(ids, key=lambda id: table.xs[cells[id]], reverse=True)
+    elif orientation == "left":
+        return sorted(ids, key=lambda id: table.xs[cells[id]])
+    elif orientation == "down":
+        return sorted(ids, key=lambda id: table.ys[cells[id]], reverse=True)
+    elif orientation == "up":
+        return sorted(ids, key=lambda id: table.ys[cells[id]])
+    return list(ids)
+
+
+def movePlayers(solution: Solution, orientation: str, table: SlideTable) -> Solution:
+    slides = table.slides[orientation]
+    food = solution.food
+    switch = solution.switch
+    if len(solution.cells) == 1:
+        slide = slides[solution.cells[0]][switch]
+        return Solution((slide.stop,), food | slide.food[-1], switch != slide.toggles[-1], table.index, solution, orientation)
+
+    cells = list(solution.cells)
+
+    for id in sortedPlayers(solution.cells, orientation, table):
+        slide = slides[cells[id]][switch]
+        stop = len(slide.cells) - 1
+        # Other players stand still while this one slides, so they can only cut the slide short.
+        for other, cell in enumerate(cells):
+            if other != id:
+                step = slide.steps.get(cell)
+                if step is not None and step <= stop:
+                    stop = step - 1
+        cells[id] = slide.cells[stop]
+        food |= slide.food[stop]
+        if slide.toggles[stop]:
+            switch = not switch
+
+    return Solution(tuple(cells), food, switch, table.index, solution, orientation)
+
+
+def successors(node: Solution, table: SlideTable, stats: SearchStats | None = None) -> List[Solution]:
+    # States after each move that changes something, moves into a wall are skipped.
+    if stats is not None:
+        start = time.perf_counter()
+        children = successors(node, table)
+        stats.move_time += time.perf_counter() - start
+        stats.successors += len(children)
+        stats.noops += len(directionDic) - len(children)
+        return children
+
+    children = []
+    for direction in ['up', 'down', 'left', 'right']:
+        newState = movePlayers(node, direction, table)
+        if newState != node:
+            children.append(newState)
+    return children
     
 
 class Cell:
@@ -213,18 +695,18 @@ class Cell:
     def reset_color(self):
         self.color = ""
 
-    def move(self, player: 'Player', orientation: str, teleported: bool, grid: CellGrid, solution: Solution):
+    def move(self, player: 'Player', orientation: str, teleported: bool, grid: CellGrid, players: Players, switch: bool, always_off_switch: bool):
 
         if self.teleport is not None and not teleported:
             newX = self.teleport["x"]
             newY = self.teleport["y"]
-            if isAnotherPlayerOnCell(newX, newY, player, solution.players):
+            if isAnotherPlayerOnCell(newX, newY, player, players):
                 return None
             else:
-                return {"cell": grid[newY][newX], "teleported": True, "switch": solution.switch}
+                return {"cell": grid[newY][newX], "teleported": True, "switch": switch, "food": False}
             
         if self.gate is not None:
-            sw = False if solution.always_off_switch else solution.switch
+            sw = False if always_off_switch else switch
             orient = self.gate.getGateOrientation(sw)
             if orient and orient == orientation:
                 return None
@@ -232,18 +714,18 @@ class Cell:
         newX = player.x + directionDic[orientation][0]
         newY = player.y + directionDic[orientation][1]
 
-        if isAnotherPlayerOnCell(newX, newY, player, solution.players) or orientation in self.walls:
+        if isAnotherPlayerOnCell(newX, newY, player, players) or orientation in self.walls:
+            return None
+
+        if newX < 0 or newX >= len(grid) or newY < 0 or newY >= len(grid):
             return None
         
         nextCell = grid[newY][newX]
-
-        if nextCell.food:
-            solution.addFood((newX, newY))
         
         if self.switch is not None:
-            solution.switch = not solution.switch
+            switch = not switch
 
-        return {"cell": nextCell, "teleported": False, "switch": solution.switch}
+        return {"cell": nextCell, "teleported": False, "switch": switch, "food": nextCell.food}
 
     def addGate(self, gate: 'Gate'):
         self.gate = gate
@@ -321,34 +803,483 @@ def count_food(grid: CellGrid) -> int:
     return sum([1 if item.food else 0 for row in grid for item in row])
 
 
-def find_path(players: Players, grid: CellGrid, switch_always_off=False) -> Path | None:
-    food_count = count_food(grid)
-    path: List[PathElement] = [{"x": player.x, "y": player.y} for player in sorted(players, key=lambda item: item.id)]
+def reachable_cells(table: SlideTable, cells: PlayerCells) -> set[int]:
+    # Cells some player can pass over. A lone player only stops where its slides end, with more
+    # players any cell of a slide can be a stop, because another player can cut the slide short,
+    # and the switch can be in either state, because another player can flip it.
+    single_player = len(cells) == 1
+    switch_states = (False, True) if table.switch_matters else (False,)
+    visited = {(cells[0], False)} if single_player else {(cell, switch) for cell in cells for switch in switch_states}
+    frontier = list(visited)
+    passed = set(cells)
+    while frontier:
+        cell, switch = frontier.pop()
+        for slides in table.slides.values():
+            slide = slides[cell][switch]
+            if single_player:
+                passed.update(slide.cells)
+                stops = [(slide.stop, table.switch_matters and switch != slide.toggles[-1])]
+            else:
+                stops = [(stop, state) for stop in slide.cells[1:] for state in switch_states]
+            for stop in stops:
+                if stop not in visited:
+                    visited.add(stop)
+                    frontier.append(stop)
+    if not single_player:
+        passed.update(cell for cell, _ in visited)
+    return passed
+
+
+def food_reachable(players: Players, grid: CellGrid, table: SlideTable | None = None) -> bool:
+    # Quick check that rules out most unsolvable maps without searching: every food cell must be
+    # passed over by some slide the players can make. Slides do not depend on where the food is,
+    # so the table may be built for the same grid without food.
+    if table is None:
+        table = SlideTable(grid)
+    cells = tuple(table.index.cell_index(player.x, player.y) for player in sorted(players, key=lambda item: item.id))
+    passed = reachable_cells(table, cells)
+    return all(table.index.cell_index(cell.x, cell.y) in passed for row in grid for cell in row if cell.food)
+
+
+def slide_graph(table: SlideTable, start: int) -> Dict[int, List[tuple[int, int]]]:
+    # Moves of a lone player as edges (target, food picked up) between nodes cell * 2 + switch,
+    # exactly the moves the search makes with it.
+    graph: Dict[int, List[tuple[int, int]]] = {}
+    frontier = [start]
+    seen = {start}
+    while frontier:
+        node = frontier.pop()
+        cell, switch = node >> 1, node & 1
+        edges = []
+        for slides in table.slides.values():
+            slide = slides[cell][switch]
+            toggled = int(table.switch_matters and slide.toggles[-1])
+            edges.append((slide.stop * 2 + (switch ^ toggled), slide.food[-1]))
+        graph[node] = edges
+        for target, _ in edges:
+            if target not in seen:
+                seen.add(target)
+                frontier.append(target)
+    return graph
+
+
+def strongly_connected_components(graph: Dict[int, List[tuple[int, int]]]) -> List[List[int]]:
+    # Tarjan's algorithm with an explicit stack, components come out in reverse topological order.
+    order: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: set[int] = set()
+    components: List[List[int]] = []
+    for root in graph:
+        if root in order:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, edge = work.pop()
+            if edge == 0:
+                order[node] = low[node] = len(order)
+                stack.append(node)
+                on_stack.add(node)
+            edges = graph[node]
+            while edge < len(edges):
+                target = edges[edge][0]
+                edge += 1
+                if target not in order:
+                    work.append((node, edge))
+                    work.append((target, 0))
+                    break
+                if target in on_stack:
+                    low[node] = min(low[node], order[target])
+            else:
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+    return components
+
+
+def maximal_masks(masks: List[int]) -> List[int]:
+    result: List[int] = []
+    for mask in sorted(set(masks), key=lambda item: -item.bit_count()):
+        if not any(mask | other == other for other in result):
+            result.append(mask)
+    return result
 
-    initial_state = Solution(players, [path], set(), False, switch_always_off)
-    queue = MyQueue([initial_state], food_count)
-    visited:set[Solution] = set()
+
+def food_coverages(graph: Dict[int, List[tuple[int, int]]], start: int, all_food: int) -> List[int] | None:
+    # Food the player can pick up in a single walk through the graph. A walk goes through a chain
+    # of components and can take every edge inside each of them, so it is enough to follow the
+    # chains of the condensed graph. None when there are too many different ways to tell.
+    components = strongly_connected_components(graph)
+    component_of = {node: number for number, component in enumerate(components) for node in component}
+    reached: Dict[int, List[int]] = {component_of[start]: [0]}
+    found: List[int] = []
+    for number in reversed(range(len(components))):
+        masks = reached.pop(number, None)
+        if masks is None:
+            continue
+        inner = 0
+        outgoing = []
+        for node in components[number]:
+            for target, food in graph[node]:
+                if component_of[target] == number:
+                    inner |= food
+                else:
+                    outgoing.append((component_of[target], food))
+        masks = maximal_masks([mask | inner for mask in masks])
+        if all_food in masks:
+            return [all_food]
+        found.extend(masks)
+        for target, food in outgoing:
+            merged = maximal_masks(reached.get(target, []) + [mask | food for mask in masks])
+            if len(merged) > MAX_FOOD_COVERAGES:
+                return None
+            reached[target] = merged
+    return maximal_masks(found)
+
+
+def prove_unsolvable(players: Players, grid: CellGrid, switch_always_off=False, table: SlideTable | None = None) -> bool:
+    # True only when no search can solve the map, False when it is solvable or this can not tell.
+    if table is None:
+        table = SlideTable(grid, switch_always_off)
+    index = table.index
+    if index.all_food == 0:
+        return False
+    if not food_reachable(players, grid, table):
+        return True
+    # Other players can stop a slide anywhere and flip the switch at any time, which leaves too
+    # many ways for the food to be picked up. A lone player's moves are fixed, so it only solves the
+    # map when one walk through its slide graph covers all the food.
+    if len(players) != 1:
+        return False
+    start = index.cell_index(players[0].x, players[0].y) * 2
+    coverages = food_coverages(slide_graph(table, start), start, index.all_food)
+    return coverages is not None and index.all_food not in coverages
+
+
+def is_unsolvable(players: Players, grid: CellGrid, switch_always_off=False, cache: SolutionCache | None = None, budget: SearchBudget | None = None) -> bool:
+    # Answer from the cache when there is one, then from the proof, and only when that can not
+    # tell from a search. A search that runs out of budget proves nothing, so it counts as solvable.
+    key = None
+    if cache is not None:
+        key = grid_key(players, grid, switch_always_off=switch_always_off, optimal=False)
+        cached = cache.get(key)
+        if cached is not None:
+            return len(cached) == 0
+
+    table = SlideTable(grid, switch_always_off)
+    if prove_unsolvable(players, grid, table=table):
+        if cache is not None and key is not None:
+            cache.put(key, [])
+        return True
+    return find_path(players, grid, switch_always_off, table, cache=cache, budget=budget) is None
+
+
+def find_path(players: Players, grid: CellGrid, switch_always_off=False, table: SlideTable | None = None, optimal=False, ida=False, cache: SolutionCache | None = None, explored: set[int] | None = None, stats: SearchStats | None = None, budget: SearchBudget | None = None) -> Path | None | Unknown:
+    if cache is not None:
+        key = grid_key(players, grid, switch_always_off=switch_always_off, optimal=optimal or ida)
+        # A cached path does not tell which cells a search explores, so when they are asked for the
+        # map is searched and the cache is only written.
+        cached = cache.get(key) if explored is None else None
+        if cached is None:
+            path = find_path(players, grid, switch_always_off, table, optimal, ida, explored=explored, stats=stats, budget=budget)
+            if path is UNKNOWN:
+                return path
+            cached = path or []
+            cache.put(key, cached)
+        return cached if len(cached) != 0 else None
+
+    start = time.perf_counter()
+    if table is None:
+        table = SlideTable(grid, switch_always_off)
+    if stats is not None:
+        stats.table_time += time.perf_counter() - start
+    index = table.index
+    ordered = sorted(players, key=lambda item: item.id)
+    cells = tuple(index.cell_index(player.x, player.y) for player in ordered)
+
+    initial_state = Solution(cells, 0, False, index)
+    if explored is not None:
+        explored.update(cells)
+    if stats is not None:
+        stats.start_search()
+    try:
+        if ida:
+            solution = find_shortest_solution_low_memory(initial_state, table, explored=explored, stats=stats, budget=budget)
+        elif optimal:
+            solution = find_shortest_solution(initial_state, table, explored, stats, budget)
+        else:
+            solution = find_first_solution(initial_state, table, explored, stats, budget)
+    except SearchInterrupted:
+        return UNKNOWN
+    finally:
+        if stats is not None:
+            stats.stop_search()
+    if solution is UNKNOWN:
+        return UNKNOWN
+    return solution.getPath(index) if solution is not None else None
+
+
+def find_first_solution(initial_state: Solution, table: SlideTable, explored: set[int] | None = None, stats: SearchStats | None = None, budget: SearchBudget | None = None) -> Solution | None:
+    queue = MyQueue([initial_state], len(table.index.food_bits))
+    visited = VisitedSet()
 
     while queue:
         node = queue.popleft()
+        if stats is not None:
+            stats.popped += 1
 
-        if node.is_equal_or_subset(visited):
+        if visited.dominates(node):
+            if stats is not None:
+                stats.prunes += 1
             continue
         visited.add(node)
 
-        if len(node.foodSet) == food_count:
-            return node.path
+        if node.food == table.index.all_food:
+            return node
 
-        for direction in ['up', 'down', 'left', 'right']:
-            newState = movePlayers(copy.deepcopy(node), direction, grid)
-            if newState == node:
-                continue
-            newState.addToPath(direction)
+        if explored is not None:
+            explored.update(node.cells)
+        if budget is not None:
+            budget.spend()
+        if stats is not None:
+            stats.expand(len(queue), len(visited))
+        for newState in successors(node, table, stats):
             queue.append(newState)
             
     return None
 
 
+def find_shortest_solution(initial_state: Solution, table: SlideTable, explored: set[int] | None = None, stats: SearchStats | None = None, budget: SearchBudget | None = None) -> Solution | None:
+    # A* over moves. The food distance heuristic is consistent, so the first goal popped is shortest.
+    estimate = table.heuristic(initial_state.cells, initial_state.food, initial_state.switch)
+    if estimate == UNREACHABLE:
+        return None
+
+    queue = MyQueue([], len(table.index.food_bits))
+    queue.append(initial_state, (estimate, estimate))
+    visited = VisitedSet(True)
+
+    while queue:
+        node = queue.popleft()
+        if stats is not None:
+            stats.popped += 1
+
+        if visited.dominates(node):
+            if stats is not None:
+                stats.prunes += 1
+            continue
+        visited.add(node)
+
+        if node.food == table.index.all_food:
+            return node
+
+        if explored is not None:
+            explored.update(node.cells)
+        if budget is not None:
+            budget.spend()
+        if stats is not None:
+            stats.expand(len(queue), len(visited))
+        for newState in successors(node, table, stats):
+            if visited.dominates(newState):
+                if stats is not None:
+                    stats.prunes += 1
+                continue
+            if explored is not None:
+                explored.update(newState.cells)
+            estimate = table.heuristic(newState.cells, newState.food, newState.switch)
+            if estimate == UNREACHABLE:
+                continue
+            queue.append(newState, (newState.depth + estimate, estimate))
+
+    return None
+
+
+def find_shortest_solution_low_memory(initial_state: Solution, table: SlideTable, transposition_size=TRANSPOSITION_SIZE, explored: set[int] | None = None, stats: SearchStats | None = None, budget: SearchBudget | None = None) -> Solution | None | Unknown:
+    # IDA*: depth-first passes with a growing bound on depth + heuristic. Memory is the current
+    # branch plus tables of at most transposition_size states: the states seen and searched in this
+    # pass, the estimates of earlier passes, and the states expanded and cut so far, which tell when
+    # an unsolvable map has been searched through. Once those are full that can not be told any
+    # more, then the search only goes on with a budget and is UNKNOWN otherwise.
+    food_bits = len(table.index.food_bits)
+    all_food = table.index.all_food
+    # Heuristic of every state estimated so far, raised to what is learned from subtrees that failed.
+    estimates: Dict[int, int] = {}
+
+    def estimate(node: Solution) -> int:
+        state = (node.key << food_bits) | node.food
+        value = estimates.get(state)
+        if value is None:
+            value = table.heuristic(node.cells, node.food, node.switch)
+            if len(estimates) < transposition_size:
+                estimates[state] = value
+        return value
+
+    # States expanded in any pass and states cut by the bound that none of them covers.
+    expanded: VisitedSet | None = VisitedSet()
+    cut: set[tuple[int, int]] = set()
+
+    bound = estimate(initial_state)
+    while bound != UNREACHABLE:
+        transpositions = VisitedSet(True)
+        transpositions.add(initial_state)
+        # States and depths of this pass whose subtree is searched -> what is left past the bound.
+        done: Dict[tuple[int, int], int] = {}
+        # Frame: node, iterator over its children (None until expanded), lowest cost past the bound
+        # for the learned estimate, and lowest cost cut by the bound for the next bound. A child left
+        # out because a state seen in this pass covers it costs at least what is left past that state,
+        # nothing when it was searched without a cut, and bound + 1 while it is not searched yet.
+        root: List[Any] = [initial_state, None, UNREACHABLE, UNREACHABLE]
+        stack = [root]
+
+        while stack:
+            frame = stack[-1]
+            node = frame[0]
+            if frame[1] is None:
+                if node.food == all_food:
+                    return node
+                if explored is not None:
+                    explored.update(node.cells)
+                if budget is not None:
+                    budget.spend()
+                if stats is not None:
+                    stats.expand(len(stack), len(transpositions) + len(estimates))
+                if expanded is not None and not expanded.dominates(node):
+                    if len(expanded) < transposition_size:
+                        expanded.add(node)
+                    else:
+                        expanded = None
+                lowest = frame[2]
+                lowest_cut = frame[3]
+                children = []
+                for newState in successors(node, table, stats):
+                    entries = transpositions.nodes.get(newState.key)
+                    if entries is not None:
+                        food = newState.food
+                        depth = newState.depth
+                        covered = None
+                        for mask, seen_depth in entries:
+                            if mask & food == food and seen_depth <= depth:
+                                remaining = done.get(((newState.key << food_bits) | mask, seen_depth))
+                                if remaining == UNREACHABLE:
+                                    covered = UNREACHABLE
+                                    break
+                                if covered is None:
+                                    covered = bound + 1
+                                if remaining is not None and depth + remaining > covered:
+                                    covered = depth + remaining
+                        if covered is not None:
+                            if covered < lowest:
+                                lowest = covered
+                            if stats is not None:
+                                stats.prunes += 1
+                            continue
+                    if explored is not None:
+                        explored.update(newState.cells)
+                    heuristic = estimate(newState)
+                    cost = UNREACHABLE if heuristic == UNREACHABLE else newState.depth + heuristic
+                    if cost > bound:
+                        if cost < lowest:
+                            lowest = cost
+                        if cost < lowest_cut:
+                            lowest_cut = cost
+                        if expanded is not None and cost != UNREACHABLE:
+                            if len(cut) < transposition_size:
+                                cut.add((newState.key, newState.food))
+                            else:
+                                expanded = None
+                        continue
+                    if len(transpositions) < transposition_size:
+                        transpositions.add(newState)
+                    children.append((cost, len(children), newState))
+                frame[2] = lowest
+                frame[3] = lowest_cut
+                children.sort()
+                frame[1] = iter([child for _, _, child in children])
+
+            child = next(frame[1], None)
+            if child is not None:
+                stack.append([child, None, UNREACHABLE, UNREACHABLE])
+                continue
+
+            stack.pop()
+            if stats is not None:
+                stats.popped += 1
+            state = (node.key << food_bits) | node.food
+            remaining = UNREACHABLE if frame[2] == UNREACHABLE else frame[2] - node.depth
+            if len(done) < transposition_size:
+                done[(state, node.depth)] = remaining
+            if remaining > estimates.get(state, 0) and (state in estimates or len(estimates) < transposition_size):
+                estimates[state] = remaining
+            if stack:
+                parent = stack[-1]
+                if frame[2] < parent[2]:
+                    parent[2] = frame[2]
+                if frame[3] < parent[3]:
+                    parent[3] = frame[3]
+
+        bound = root[3]
+        if expanded is not None:
+            cut = {(key, food) for key, food in cut if not expanded.covers(key, food)}
+            if len(cut) == 0:
+                break
+        elif budget is None:
+            return UNKNOWN
+
+    return None
+
+
+class SearchRecord:
+
+    def __init__(self, path: Path | None | Unknown, table: SlideTable, explored: set[int] | None, switch_always_off=False, optimal=False, ida=False):
+        # Cells players were moved from or estimated on, None when the path came from a cache
+        # or the search could not tell.
+        self.path = path
+        self.table = table
+        self.explored = explored
+        self.switch_always_off = switch_always_off
+        self.optimal = optimal
+        self.ida = ida
+
+
+def find_path_record(players: Players, grid: CellGrid, switch_always_off=False, optimal=False, ida=False, table: SlideTable | None = None, budget: SearchBudget | None = None) -> SearchRecord:
+    if table is None:
+        table = SlideTable(grid, switch_always_off)
+    explored: set[int] = set()
+    path = find_path(players, grid, switch_always_off, table, optimal, ida, explored=explored, budget=budget)
+    return SearchRecord(path, table, explored if path is not UNKNOWN else None, switch_always_off, optimal, ida)
+
+
+def find_path_after_edit(players: Players, grid: CellGrid, previous: SearchRecord, edited: List[tuple[int, int]], cache: SolutionCache | None = None, budget: SearchBudget | None = None) -> SearchRecord:
+    # Re-solve a grid that differs from the previously solved one only in the edited cells, with
+    # the same players. Only the slides passing over the edited cells are rebuilt, and when none
+    # of the slides (or estimates) the previous search looked at changed, it would go exactly the
+    # same way again, so its path is reused without searching.
+    table = SlideTable(grid, previous.switch_always_off, previous.table, edited)
+    heuristic = previous.optimal or previous.ida
+    if previous.explored is not None and previous.table.same_moves(table, previous.explored, heuristic):
+        return SearchRecord(previous.path, table, previous.explored, previous.switch_always_off, previous.optimal, previous.ida)
+
+    if cache is not None:
+        key = grid_key(players, grid, switch_always_off=previous.switch_always_off, optimal=heuristic)
+        cached = cache.get(key)
+        if cached is not None:
+            return SearchRecord(cached if len(cached) != 0 else None, table, None, previous.switch_always_off, previous.optimal, previous.ida)
+
+    record = find_path_record(players, grid, previous.switch_always_off, previous.optimal, previous.ida, table, budget)
+    if cache is not None and record.path is not UNKNOWN:
+        cache.put(key, record.path or [])
+    return record
+
+
 def map_path(solution: Path):
     return [item[0]['orient'] for item in solution if 'orient' in item[0]]
 
@@ -359,33 +1290,123 @@ def map_solution_to_keys(solution: Path | None) -> List[str]:
     return map_path(solution)
 
 
-def solveMap(base_path: str, map_name: str) -> List[str]:
+def print_stats(map_name: str, stats: SearchStats):
+    print(f"{map_name}: {stats}", file=sys.stderr, flush=True)
+
+
+def solveMap(base_path: str, map_name: str, optimal=False, ida=False, cache_folder: str | None = None, show_stats=False, progress: int | None = None, max_nodes: int | None = None, timeout: float | None = None) -> List[str] | None:
     map = load_map(f"./{base_path}/{map_name}")
     grid, players = initializeGame(map)
+    cache = folder_cache(cache_folder) if cache_folder is not None else None
+    stats = None
+    if show_stats:
+        stats = SearchStats(partial(print_stats, f"{map_name} (running)") if progress else None, progress or 1)
 
-    solved = find_path(players, grid)
+    budget = SearchBudget(max_nodes, timeout) if max_nodes is not None or timeout is not None else None
 
+    solved = find_path(players, grid, optimal=optimal, ida=ida, cache=cache, stats=stats, budget=budget)
+
+    if stats is not None:
+        print_stats(map_name, stats)
+    if solved is UNKNOWN:
+        return None
     return map_solution_to_keys(solved)
 
 
-def solve(base_path: str):
-    maps = [file for file in os.listdir(base_path) if ".json" in file]
+def list_maps(base_path: str) -> List[str]:
+    return sorted(file for file in os.listdir(base_path) if ".json" in file)
+
+
+def timed_solve(solve_one: Callable[[str], List[str] | None], map_name: str) -> tuple[str, List[str] | None, float]:
+    start = time.perf_counter()
+    keys = solve_one(map_name)
+    return map_name, keys, time.perf_counter() - start
+
+
+def solve_each(base_path: str, maps: List[str], optimal=False, ida=False, jobs=1, cache_folder: str | None = None, show_stats=False, progress: int | None = None, max_nodes: int | None = None, timeout: float | None = None) -> Iterator[tuple[str, List[str] | None, float]]:
+    # Every map with its keys and solving time as soon as it is solved, in the order they finish.
+    solve_one = partial(timed_solve, partial(solveMap, base_path, optimal=optimal, ida=ida, cache_folder=cache_folder, show_stats=show_stats, progress=progress, max_nodes=max_nodes, timeout=timeout))
+    if jobs > 1 and len(maps) > 1:
+        with Pool(min(jobs, len(maps))) as pool:
+            yield from pool.imap_unordered(solve_one, maps)
+    else:
+        for map in maps:
+            yield solve_one(map)
+
+
+def solve(base_path: str, optimal=False, ida=False, jobs=1, cache_folder: str | None = None, show_stats=False, progress: int | None = None, max_nodes: int | None = None, timeout: float | None = None):
+    maps = list_maps(base_path)
+    solutions = {map: keys for map, keys, _ in solve_each(base_path, maps, optimal, ida, jobs, cache_folder, show_stats, progress, max_nodes, timeout)}
+
     result = {}
     for map in maps:
-        temp = solveMap(base_path, map)
-        result[map] = temp if temp is not None else []
+        # None when the search could not tell, an unsolvable map has no keys.
+        result[map] = solutions[map]
 
     return result
 
 
+def stream_line(map_name: str, keys: List[str] | None, seconds: float) -> str:
+    return json.dumps({"map": map_name, "keys": keys, "length": len(keys) if keys is not None else None, "time": round(seconds, 6)})
+
+
+def load_stream(file_name: str) -> Dict[str, Any]:
+    # Lines of an earlier streamed run by map. An interrupted run can leave its last line cut off,
+    # it is left out.
+    results = {}
+    if os.path.exists(file_name):
+        with open(file_name, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and "map" in entry:
+                    results[entry["map"]] = entry
+    return results
+
+
+def solve_stream(base_path: str, maps: List[str], output: str | None = None, resume=False, optimal=False, ida=False, jobs=1, cache_folder: str | None = None, show_stats=False, progress: int | None = None, max_nodes: int | None = None, timeout: float | None = None):
+    if output is not None and resume:
+        done = load_stream(output)
+        maps = [map for map in maps if map not in done]
+        # Written again so that a cut off last line does not end up in front of the next one.
+        with open(output, "w") as f:
+            for entry in done.values():
+                f.write(json.dumps(entry) + "\n")
+
+    out = open(output, "a" if resume else "w") if output is not None else sys.stdout
+    try:
+        for map, keys, seconds in solve_each(base_path, maps, optimal, ida, jobs, cache_folder, show_stats, progress, max_nodes, timeout):
+            print(stream_line(map, keys, seconds), file=out, flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
 if __name__ == "__main__":
     args = parser.parse_args()
     if not os.path.exists(args.input_folder):
         parser.error("Input folder does not exist.")
-    if args.map:
+    if args.progress is not None and not args.stats:
+        parser.error("--progress needs --stats.")
+    if args.progress is not None and args.progress < 1:
+        parser.error("Progress should be printed at least every 1 expanded node.")
+    if (args.max_nodes is not None and args.max_nodes < 0) or (args.timeout is not None and args.timeout < 0):
+        parser.error("Node and time budget can not be negative.")
+    if args.resume and (not args.stream or not args.output):
+        parser.error("Resuming needs --stream and --output.")
+    if args.stream:
+        if args.jobs < 1:
+            parser.error("Number of jobs should be at least 1.")
+        if args.map and not os.path.exists(f"{args.input_folder}/{args.map}"):
+            parser.error("Map does not exist.")
+        maps = [args.map] if args.map else list_maps(args.input_folder)
+        solve_stream(args.input_folder, maps, args.output, args.resume, args.optimal, args.ida, args.jobs, args.cache, args.stats, args.progress, args.max_nodes, args.timeout)
+    elif args.map:
         if not os.path.exists(f"{args.input_folder}/{args.map}"):
             parser.error("Map does not exist.")
-        res = solveMap(args.input_folder, args.map)
+        res = solveMap(args.input_folder, args.map, args.optimal, args.ida, args.cache, args.stats, args.progress, args.max_nodes, args.timeout)
         result = {args.map: res}
         if args.output:
             with open(args.output, "w") as f:
@@ -393,7 +1414,9 @@ if __name__ == "__main__":
         else:
             print(result)
     else:
-        result = solve(args.input_folder)
+        if args.jobs < 1:
+            parser.error("Number of jobs should be at least 1.")
+        result = solve(args.input_folder, args.optimal, args.ida, args.jobs, args.cache, args.stats, args.progress, args.max_nodes, args.timeout)
         if args.output:
             with open(args.output, "w") as f:
                 json.dump(result, f)
@@ -1,11 +1,19 @@
 import os
 import json
 import argparse
+from functools import partial
+from multiprocessing import Pool
+from solver import initializeGame, is_unsolvable, SearchBudget
 parser = argparse.ArgumentParser(description='Optional app description')
 parser.add_argument('input_folder', type=str,
                     help='Folder name of the original maps in txt format.')
 parser.add_argument('output_folder', type=str,
                     help='Folder name of the output folder.')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Number of worker processes converting the maps.')
+parser.add_argument('--solve', action='store_true', help='Solve every converted map and leave out the unsolvable ones.')
+parser.add_argument('--max-nodes', type=int, help='With --solve, keep a map after expanding this many nodes without knowing if it is solvable.')
+parser.add_argument('--timeout', type=float, help='With --solve, keep a map after this many seconds without knowing if it is solvable.')
+parser.add_argument('--compact', action='store_true', help='Write the JSON maps without indentation.')
 
 def parse_size(line):
     line = line.strip()
@@ -46,6 +54,24 @@ def parse_cell(num, x, y):
     return cell, player if player else None
 
 
+# parse_cell of every value a cell can have, so that converting a cell is one lookup.
+cell_table = [parse_cell(num, 0, 0) for num in range(64)]
+
+
+def decode_cell(num, x, y):
+    if num < 0 or num >= len(cell_table):
+        return parse_cell(num, x, y)
+    template, player = cell_table[num]
+    cell = {
+        "x": x,
+        "y": y,
+        "walls": list(template["walls"])
+    }
+    if "food" in template:
+        cell["food"] = True
+    return cell, {"x": x, "y": y} if player is not None else None
+
+
 def parse_game(size, lines):
     food_count = 0
     game = { "gridSize" : size, "players": []}
@@ -56,7 +82,7 @@ def parse_game(size, lines):
         line = y.strip().split(",")
         for index_x, x in enumerate(line):
             num = int(x)
-            cell, player = parse_cell(num, index_x, index_y)
+            cell, player = decode_cell(num, index_x, index_y)
             if player is not None:
                 game["players"].append(player)
             
@@ -68,30 +94,61 @@ def parse_game(size, lines):
     return game
 
 
+def convert_level(input_folder, solve, max_nodes, timeout, compact, item):
+    # JSON of the level, or None with the reason it is left out.
+    with open(f"./{input_folder}/{item}", "r") as f:
+        lines = f.readlines()
+    is_valid_size, size = parse_size(lines[0]) if lines else (False, 0)
+    if not is_valid_size:
+        return None, "invalid size"
+
+    game = parse_game(size, lines[1:size+1])
+    if solve:
+        budget = SearchBudget(max_nodes, timeout) if max_nodes is not None or timeout is not None else None
+        try:
+            grid, players = initializeGame(game)
+            if is_unsolvable(players, grid, budget=budget):
+                return None, "unsolvable"
+        except IndexError:
+            return None, "cells outside of the grid"
+
+    return json.dumps(game, indent=None if compact else 4), None
+
+
+def convert_levels(files, convert, jobs):
+    # Levels are converted in the workers while the ones before them are written, in order, so
+    # that the numbering does not depend on the number of workers.
+    if jobs > 1 and len(files) > 1:
+        with Pool(min(jobs, len(files))) as pool:
+            yield from pool.imap(convert, files, chunksize=max(1, len(files) // (jobs * 8)))
+    else:
+        yield from map(convert, files)
+
+
 if __name__ == "__main__":
     args = parser.parse_args()
     if not os.path.exists(args.input_folder):
         parser.error("Input folder does not exist.")
+    if args.jobs < 1:
+        parser.error("Number of jobs should be at least 1.")
+    if (args.max_nodes is not None and args.max_nodes < 0) or (args.timeout is not None and args.timeout < 0):
+        parser.error("Node and time budget can not be negative.")
     if not os.path.exists(args.output_folder):
         os.makedirs(args.output_folder)
-    files = os.listdir(args.input_folder)
+    files = sorted(file for file in os.listdir(args.input_folder) if ".txt" in file.lower())
+    convert = partial(convert_level, args.input_folder, args.solve, args.max_nodes, args.timeout, args.compact)
     index = 1
+    left_out = 0
 
-    for item in [file for file in files if ".txt" in file.lower()]:
-        
-        with open(f"./{args.input_folder}/{item}", "r") as f:
-            lines = f.readlines()
-            is_valid_size, size = parse_size(lines[0])
-            
-            if not is_valid_size:
-                continue
+    for item, (game_json, reason) in zip(files, convert_levels(files, convert, args.jobs)):
+        if game_json is None:
+            print(f"{item}: left out, {reason}")
+            left_out += 1
+            continue
 
-            game = parse_game(size, lines[1:size+1])
-            pretty_json = json.dumps(game, indent=4)
+        with open(f"./{args.output_folder}/map{index}.json", 'w') as json_file:
+            json_file.write(game_json)
 
-            with open(f"./{args.output_folder}/map{index}.json", 'w') as json_file:
-                json_file.write(pretty_json)
+        index += 1
 
-            index += 1
-        
-        
\ No newline at end of file
+    print(f"Converted {index - 1} maps, left out {left_out}.")
@@ -0,0 +1,155 @@
+from solver import initializeGame, load_map, load_stream, list_maps, movePlayers, SlideTable, Solution, NonOptionalPathElement, directionDic
+from typing import Any, Dict, List, TypedDict
+import argparse
+import json
+import os
+import sys
+
+parser = argparse.ArgumentParser(description='Replay stored key sequences on maps and check that they still solve them.')
+parser.add_argument('input_folder', type=str, help='Folder name of the maps to be verified.')
+parser.add_argument('-s', '--solutions', type=str, help='Solutions of solve(), a JSON object or the JSON lines of --stream.')
+parser.add_argument('-m', '--map', type=str, help='Particular name of the map to verify.')
+parser.add_argument('-k', '--keys', type=str, help='With --map, comma separated keys to verify instead of the stored ones.')
+parser.add_argument('-o', '--output', type=str, help='Name of the output file for the results, otherwise only the summary is printed.')
+
+
+class Verification(TypedDict):
+    solved: bool
+    # Keys played, and the first key that could not be played counted from 1.
+    steps: int
+    failed_step: int | None
+    reason: str | None
+    players: List[NonOptionalPathElement]
+    food_left: int
+    switch: bool
+
+
+def verify(map: Any, keys: List[str], table: SlideTable | None = None) -> Verification:
+    # Plays the keys with the moves of the solver, every key is one lookup in the slide table.
+    # Keys the solver never gives fail the replay: a key that moves no player, because then the
+    # map changed under the solution, and keys after all food is eaten, because the game ends there.
+    grid, players = initializeGame(map)
+    if table is None:
+        table = SlideTable(grid)
+    index = table.index
+    ordered = sorted(players, key=lambda item: item.id)
+    state = Solution(tuple(index.cell_index(player.x, player.y) for player in ordered), 0, False, index)
+
+    failed_step = None
+    reason = None
+    for step, key in enumerate(keys, 1):
+        if key not in directionDic:
+            failed_step, reason = step, f"unknown key {key}"
+            break
+        if state.food == index.all_food:
+            failed_step, reason = step, "map is already solved"
+            break
+        next_state = movePlayers(state, key, table)
+        if next_state == state:
+            failed_step, reason = step, f"{key} does not move any player"
+            break
+        # Only the last state is needed, so the chain of parents is not kept.
+        next_state.parent = None
+        state = next_state
+
+    food_left = (index.all_food & ~state.food).bit_count()
+    if reason is None and food_left != 0:
+        reason = f"{food_left} food left"
+    return {
+        "solved": reason is None,
+        "steps": len(keys) if failed_step is None else failed_step - 1,
+        "failed_step": failed_step,
+        "reason": reason,
+        "players": [{"x": cell % index.size, "y": cell // index.size} for cell in state.cells],
+        "food_left": food_left,
+        "switch": state.switch
+    }
+
+
+def not_verified(reason: str) -> Verification:
+    return {"solved": False, "steps": 0, "failed_step": None, "reason": reason, "players": [], "food_left": 0, "switch": False}
+
+
+def load_solutions(file_name: str) -> Dict[str, List[str] | None]:
+    # The JSON object of solve(), or the JSON lines of a streamed run.
+    with open(file_name, "r") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            data = None
+    if isinstance(data, dict) and not ("map" in data and "keys" in data):
+        return data
+    return {name: entry.get("keys") for name, entry in load_stream(file_name).items()}
+
+
+def verify_map(base_path: str, map_name: str, keys: List[str]) -> Verification:
+    try:
+        return verify(load_map(f"{base_path}/{map_name}"), keys)
+    except IndexError:
+        return not_verified("cells outside of the grid")
+
+
+def verify_folder(base_path: str, solutions: Dict[str, List[str] | None]) -> Dict[str, Verification | None]:
+    # Results of every map of the folder with a stored solution. Maps that ran out of budget or were
+    # found unsolvable have no keys to replay, they are None.
+    maps = set(list_maps(base_path))
+    results: Dict[str, Verification | None] = {}
+    for map_name in sorted(solutions.keys()):
+        keys = solutions[map_name]
+        if map_name not in maps:
+            results[map_name] = not_verified("map does not exist")
+        elif keys is None or len(keys) == 0:
+            results[map_name] = None
+        else:
+            results[map_name] = verify_map(base_path, map_name, keys)
+    return results
+
+
+def describe(map_name: str, result: Verification) -> str:
+    if result["solved"]:
+        return f"{map_name}: solved in {result['steps']} keys"
+    players = ", ".join(f"({item['x']}, {item['y']})" for item in result["players"])
+    if result["failed_step"] is not None:
+        return f"{map_name}: failed at step {result['failed_step']}, {result['reason']}, players at {players}"
+    return f"{map_name}: not solved, {result['reason']}, players at {players}"
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if not os.path.exists(args.input_folder):
+        parser.error("Input folder does not exist.")
+    if args.keys is not None and not args.map:
+        parser.error("Keys need --map.")
+    if args.keys is None and not args.solutions:
+        parser.error("Give the solutions file, or a map with its keys.")
+    if args.solutions and not os.path.exists(args.solutions):
+        parser.error("Solutions file does not exist.")
+    if args.map and not os.path.exists(f"{args.input_folder}/{args.map}"):
+        parser.error("Map does not exist.")
+
+    if args.keys is not None:
+        solutions: Dict[str, List[str] | None] = {args.map: [key.strip() for key in args.keys.split(",") if key.strip()]}
+    else:
+        solutions = load_solutions(args.solutions)
+        if args.map:
+            if args.map not in solutions:
+                parser.error("Map has no stored solution.")
+            solutions = {args.map: solutions[args.map]}
+
+    results = verify_folder(args.input_folder, solutions)
+    failed = 0
+    for map_name, result in results.items():
+        if result is not None and not result["solved"]:
+            failed += 1
+            print(describe(map_name, result))
+    result = results.get(args.map) if args.map else None
+    if result is not None and result["solved"]:
+        print(describe(args.map, result))
+    skipped = sum(1 for result in results.values() if result is None)
+    print(f"Verified {len(results) - skipped} maps, {failed} failed, {skipped} without keys.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+    if failed != 0:
+        sys.exit(1)